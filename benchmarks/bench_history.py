@@ -0,0 +1,69 @@
+"""
+运行历史数据库的基准测试：写入大量合成运行，然后测量各查询的耗时。
+
+用法：python -m benchmarks.bench_history [运行数量]
+"""
+import os
+import random
+import sys
+import tempfile
+from time import perf_counter
+
+from src.analyzer import RelRun
+from src.enums.damage_types import DT
+from src.history import RunHistory, HistoryFilter
+
+PLAYERS = [f'Player{i}' for i in range(40)]
+
+
+def synthetic_run(rnd: random.Random, run_nr: int) -> RelRun:
+    nickname = rnd.choice(PLAYERS)
+    squad = {nickname, *rnd.sample(PLAYERS, 3)}
+    pt_found = rnd.uniform(15, 30)
+    shield_phases = {phase: [(rnd.choice(list(DT)), rnd.uniform(1, 8)) for _ in range(rnd.randint(3, 5))]
+                     for phase in [1, 3, 4]}
+    shield_phases[3.5] = []
+    legs = {phase: [rnd.uniform(1, 5) for _ in range(4)] for phase in [1, 2, 3, 4]}
+    body_dur = {phase: rnd.uniform(1, 4) for phase in [1, 2, 3, 4]}
+    pylon_dur = {phase: rnd.uniform(10, 20) for phase in [1, 3]}
+    phase_durations, elapsed = {}, pt_found
+    for phase in [1, 2, 3, 4]:
+        elapsed += sum(time for _, time in shield_phases.get(phase, [])) + sum(legs[phase])
+        elapsed += body_dur[phase] + pylon_dur.get(phase, 0)
+        phase_durations[phase] = elapsed
+    return RelRun(run_nr, nickname, squad, pt_found, phase_durations, shield_phases, legs, body_dur, pylon_dur)
+
+
+def timed(label: str, func):
+    start = perf_counter()
+    result = func()
+    print(f'{label:<28}{(perf_counter() - start) * 1000:9.1f} ms')
+    return result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rnd = random.Random(0)
+    runs = [synthetic_run(rnd, i) for i in range(count)]
+    now = 1_700_000_000.0
+
+    with tempfile.TemporaryDirectory() as directory:
+        with RunHistory(os.path.join(directory, 'history.db'), batch_size=5000) as history:
+            def insert():
+                for i, run in enumerate(runs):
+                    history.add(run, now - i * 60)
+                history.flush()
+            timed(f'写入 {count} 次运行', insert)
+
+            everything = HistoryFilter()
+            squad = HistoryFilter(players=PLAYERS[:2])
+            recent = HistoryFilter(nickname=PLAYERS[0], since=now - 30 * 86400)
+            for label, filter_ in [('全部', everything), ('小队', squad), ('玩家 + 最近 30 天', recent)]:
+                timed(f'最佳运行（{label}）', lambda: history.best_run(filter_))
+                timed(f'中位数（{label}）', lambda: history.medians(filter_))
+                timed(f'腿部中位数（{label}）', lambda: history.leg_median(filter_))
+                timed(f'护盾分布（{label}）', lambda: history.shield_distribution(filter_))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+合并日志的基准测试与检查：生成同一小队两名队员的合成日志，其中队友的时钟有偏移且加载得更慢，每个日志各自丢失一部分
+战斗行。检查估计的时钟偏移、合并后没有重复的事件，并比较单个日志与合并日志中通过完整性检查的运行数量。
+
+用法：python -m benchmarks.bench_merge [运行数量]
+"""
+import os
+import random
+import sys
+import tempfile
+from time import perf_counter
+
+from src.analyzer import Analyzer
+from src.constants import PTConstants, MiscConstants
+from src.merge import align, merge_lines
+
+CLOCK_OFFSET = -77.0  # 秒，加到队友日志的时间上使其与主日志对齐
+SLOWER_LOAD = 3.0  # 秒，队友比主日志的玩家晚加载完成
+DROP_RATE = 0.04  # 每个日志各自丢失的战斗行比例
+SHIELDS = ['DT_FIRE', 'DT_FREEZE', 'DT_ELECTRICITY', 'DT_POISON', 'DT_MAGNETIC']
+
+
+def fight(rnd: random.Random, start: float) -> tuple[list[tuple[float, str]], float]:
+    """返回一次完整战斗的 (时间, 行内容) 和战斗结束的时间。"""
+    events, t = [], start
+
+    def add(text: str, step: float) -> None:
+        nonlocal t
+        t += step
+        events.append((t, text))
+
+    add(f'Script [Info]: {PTConstants.PHASE_1_START}', 0)
+    for phase in [1, 2, 3, 4]:
+        if phase in [1, 3, 4]:
+            for _ in range(5):
+                add(f'Script [Info]: {PTConstants.SHIELD_SWITCH} {rnd.choice(SHIELDS)}', rnd.uniform(1.5, 4))
+            if phase == 3:  # 支柱阶段期间的护盾属于阶段 3.5
+                add(f'Script [Info]: {PTConstants.PYLONS_LAUNCHED}', rnd.uniform(1.5, 4))
+                add(f'Script [Info]: {PTConstants.SHIELD_SWITCH} {rnd.choice(SHIELDS)}', rnd.uniform(1.5, 4))
+            add(f'Script [Info]: {PTConstants.SHIELD_PHASE_ENDINGS[phase]}', rnd.uniform(1.5, 4))
+        for part in range(4):
+            add(f'Script [Info]: {PTConstants.LEG_KILL} {part}', rnd.uniform(1.5, 4))
+        add(f'Script [Info]: {PTConstants.BODY_VULNERABLE}', rnd.uniform(1.5, 3))
+        if phase == 4:
+            add(f'Script [Info]: {PTConstants.BODY_VULNERABLE}', rnd.uniform(1.5, 3))
+            add(f'Script [Info]: {PTConstants.BODY_VULNERABLE}', rnd.uniform(1.5, 3))
+            break
+        add(f'Script [Info]: {PTConstants.STATE_CHANGE}{[3, 5, 6][phase - 1]}', rnd.uniform(1.5, 3))
+        if phase == 1:
+            add(f'Script [Info]: {PTConstants.PYLONS_LAUNCHED}', rnd.uniform(1.5, 4))
+        add(f'Script [Info]: {PTConstants.PHASE_ENDS[phase]}', rnd.uniform(8, 15))
+    return events, t
+
+
+def write_logs(directory: str, runs: int, seed: int = 0) -> list[str]:
+    """写入主日志和队友日志，返回它们的路径。"""
+    rnd = random.Random(seed)
+    players = ['Host', 'Mate']
+    lines: list[list[tuple[float, str]]] = [[(0.0, f'Net [Info]: {MiscConstants.NICKNAME}{name}, 1')] for name in players]
+    t = 10.0
+    for _ in range(runs):
+        for i, log in enumerate(lines):
+            load = t + i * SLOWER_LOAD
+            log.append((load, f'Script [Info]: ThemedSquadOverlay.lua: Mission name: {MiscConstants.HEIST_START}'))
+            log += [(load + 1 + j, f'Game [Info]: {name} {MiscConstants.SQUAD_MEMBER}') for j, name in enumerate(players)]
+            log.append((load + 4, f'Script [Info]: {MiscConstants.ELEVATOR_EXIT}'))
+        events, t = fight(rnd, t + 30)
+        for log in lines:
+            log += [(time + rnd.uniform(0, 0.2), text) for time, text in events if rnd.random() >= DROP_RATE]
+        t += 40
+
+    paths = []
+    for i, log in enumerate(lines):
+        paths.append(os.path.join(directory, f'{players[i]}.log'))
+        with open(paths[-1], 'w', encoding='latin-1') as file:
+            for time, text in sorted(log):
+                file.write(f'{time - i * CLOCK_OFFSET:.3f} {text}\n')
+    return paths
+
+
+def valid_runs(lines) -> int:
+    analyzer = Analyzer(keep_runs=True)
+    analyzer.analyze_lines(iter(lines), 0.0)
+    return len(analyzer.proper_runs)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_logs(directory, runs)
+
+        start = perf_counter()
+        offsets = align(paths)
+        merged = list(merge_lines(paths, offsets))
+        elapsed = (perf_counter() - start) * 1000
+        print(f'对齐并合并 {len(merged)} 行：{elapsed:.1f} ms')
+
+        error = abs(offsets[1] - CLOCK_OFFSET)
+        print(f'估计的时钟偏移：{offsets[1]:+.3f}s（实际 {CLOCK_OFFSET:+.3f}s）')
+        assert error < 0.5, f'时钟偏移误差 {error:.3f}s 超过了去重时间窗口'
+        leg_kills = sum(PTConstants.LEG_KILL in line for line in merged)
+        assert leg_kills <= 16 * runs, f'合并后有 {leg_kills} 次腿部击杀，最多应有 {16 * runs} 次：去重失败'
+
+        with open(paths[0], 'r', encoding='latin-1') as file:
+            primary = valid_runs(file.readlines())
+        merged_valid = valid_runs(merged)
+        print(f'有效运行：主日志 {primary}/{runs}，合并后 {merged_valid}/{runs}')
+        assert merged_valid >= primary, '合并后的有效运行少于主日志'
+
+
+if __name__ == '__main__':
+    main()
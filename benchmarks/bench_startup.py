@@ -0,0 +1,97 @@
+"""
+冷启动的基准测试：用 ``-X importtime`` 列出 ``import main`` 中最耗时的模块，并测量从进程启动到分析器解析出日志中
+第一个事件所需的时间（拖入日志时用户感受到的启动时间）。
+
+用法：python -m benchmarks.bench_startup [日志] [重复次数]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+from statistics import median
+from time import perf_counter
+
+TARGET_MS = 100  # 无颜色模式下到第一个事件的目标时间（包括解释器本身的启动时间）
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 在子进程中以拖入日志的方式启动，并在分析器报告第一个事件时立即退出。
+FIRST_EVENT = '''
+import sys
+import main
+from src import style
+from src.distiller import log_lines
+from src.listeners import RunListener
+
+class FirstEvent(RunListener):
+    def on_event(self, run, event, phase, time):
+        raise SystemExit(0)
+
+args = main.parse_args(sys.argv[1:])
+style.init(color=not args.no_color)
+analyzer = main.create_analyzer(args)
+analyzer.listeners.append(FirstEvent())
+with open(args.log, 'r', encoding='latin-1') as file:
+    analyzer.analyze_lines(log_lines(file), 0.0)
+sys.exit('日志中没有事件')
+'''
+
+
+def synthetic_log(path: str, chatter: int = 20000) -> None:
+    """写入一个在第一个事件之前有 ``chatter`` 行无关内容的日志，类似于进入任务前的 EE.log。"""
+    with open(path, 'w', encoding='latin-1') as file:
+        for i in range(chatter):
+            file.write(f'{i / 1000:.3f} Sys [Info]: some irrelevant chatter {i}\n')
+        file.write('20.000 Script [Info]: ThemedSquadOverlay.lua: Mission name: '
+                   'jobId=/Lotus/Types/Gameplay/Venus/Jobs/Heists/HeistProfitTakerBountyFour\n')
+        file.write('24.000 Script [Info]: EidolonMP.lua: EIDOLONMP: Avatar left the zone\n')
+        file.write('44.000 Script [Info]: Orb Fight - Starting first attack Orb phase\n')
+        file.write('46.000 Script [Info]: SwitchShieldVulnerability DT_CORROSIVE\n')
+
+
+def import_times() -> list[tuple[int, int, str]]:
+    """返回 ``import main`` 导入的每个模块的 (自身微秒, 累计微秒, 模块名)。"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times.append((int(self_us), int(cumulative_us), name.strip()))
+    return times
+
+
+def timed_run(args: list[str], repeat: int) -> float:
+    """返回以 ``args`` 启动子进程的中位数墙钟时间（毫秒）。"""
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        subprocess.run([sys.executable, *args], cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        times.append((perf_counter() - start) * 1000)
+    return median(times)
+
+
+def main():
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    with tempfile.TemporaryDirectory() as directory:
+        log = sys.argv[1] if len(sys.argv) > 1 else os.path.join(directory, 'EE.log')
+        if len(sys.argv) <= 1:
+            synthetic_log(log)
+
+        times = import_times()
+        total = next(cumulative for _, cumulative, name in times if name == 'main')
+        print(f'import main：{total / 1000:.1f} ms，最耗时的模块（累计）：')
+        for self_us, cumulative_us, name in sorted(times, key=lambda t: t[1], reverse=True)[1:11]:
+            print(f'  {cumulative_us / 1000:7.1f} ms  {self_us / 1000:7.1f} ms  {name}')
+
+        interpreter = timed_run(['-c', 'pass'], repeat)
+        print(f'\n解释器启动：{interpreter:.1f} ms')
+        for label, flags in [('彩色', []), ('无颜色', ['--no-color'])]:
+            elapsed = timed_run(['-c', FIRST_EVENT, log, *flags], repeat)
+            print(f'{label}模式下到第一个事件：{elapsed:.1f} ms（除去解释器启动 {elapsed - interpreter:.1f} ms）')
+        status = '达到' if elapsed <= TARGET_MS else '未达到'
+        print(f'目标：无颜色模式下 {TARGET_MS} ms 以内，{status}')
+
+
+if __name__ == '__main__':
+    main()
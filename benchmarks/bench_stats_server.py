@@ -0,0 +1,97 @@
+"""
+HTTP 统计服务器的本地负载测试：许多客户端通过保持的连接以 If-None-Match 轮询，同时模拟运行中的事件。
+
+用法：python -m benchmarks.bench_stats_server [客户端数量] [每个客户端的请求数]
+"""
+import http.client
+import random
+import sys
+import threading
+from statistics import median, quantiles
+from time import perf_counter, sleep
+
+from benchmarks.bench_history import synthetic_run
+from src.analyzer import Analyzer, AbsRun
+from src.listeners import RunEvent
+from src.stats_server import StatsState, StatsServer
+
+RESOURCES = ['/state', '/last', '/summary']
+
+
+def poll(port: int, requests: int, latencies: list[float], statuses: dict[int, int], lock: threading.Lock):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    etags: dict[str, str] = {}
+    local_latencies, local_statuses = [], {}
+    for i in range(requests):
+        resource = RESOURCES[i % len(RESOURCES)]
+        headers = {'If-None-Match': etags[resource]} if resource in etags else {}
+        start = perf_counter()
+        conn.request('GET', resource, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        local_latencies.append(perf_counter() - start)
+        local_statuses[response.status] = local_statuses.get(response.status, 0) + 1
+        etags[resource] = response.getheader('ETag')
+    conn.close()
+    with lock:
+        latencies.extend(local_latencies)
+        for status, count in local_statuses.items():
+            statuses[status] = statuses.get(status, 0) + count
+
+
+def simulate_events(state: StatsState, analyzer: Analyzer, stop: threading.Event):
+    """以每秒约 20 个事件的频率模拟运行，每 100 个事件结束一次运行。"""
+    rnd = random.Random(1)
+    run = AbsRun(1)
+    while not stop.is_set():
+        for i in range(100):
+            run.legs[1].append(float(i))
+            state.on_event(run, RunEvent.LEG_KILL, 1, float(i))
+            sleep(0.05)
+            if stop.is_set():
+                return
+        finished = synthetic_run(rnd, analyzer.run_count + 1)
+        analyzer.record_run(finished, 0.0)
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    analyzer = Analyzer()
+    rnd = random.Random(0)
+    for i in range(1000):  # 让 /summary 的计算有一定的成本
+        analyzer.record_run(synthetic_run(rnd, i + 1), 0.0)
+    state = StatsState(analyzer)
+    analyzer.listeners.append(state)
+    state.on_run(analyzer.proper_runs[-1])
+
+    server = StatsServer(state, 0, '127.0.0.1')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    stop = threading.Event()
+    threading.Thread(target=simulate_events, args=(state, analyzer, stop), daemon=True).start()
+
+    latencies, statuses, lock = [], {}, threading.Lock()
+    threads = [threading.Thread(target=poll, args=(port, requests, latencies, statuses, lock))
+               for _ in range(clients)]
+    start = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - start
+    stop.set()
+    server.shutdown()
+
+    total = len(latencies)
+    print(f'{clients} 个客户端，共 {total} 个请求，用时 {elapsed:.2f}s（{total / elapsed:.0f} 请求/秒）')
+    print(f'状态码：{dict(sorted(statuses.items()))}')
+    print(f'延迟中位数 {median(latencies) * 1000:.2f} ms，'
+          f'p99 {quantiles(latencies, n=100)[98] * 1000:.2f} ms')
+    print(f'模拟事件 {state.event_id} 个，资源共变化 {sum(state.versions.values())} 次（每次变化最多序列化一次）')
+
+
+if __name__ == '__main__':
+    main()
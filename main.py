@@ -1,15 +1,23 @@
-import traceback
+from __future__ import annotations
+
+import argparse
 import os
-import socket
 import sys
 import threading
-from io import StringIO
-from sty import fg
-import colorama
+import time
+from typing import Optional, TYPE_CHECKING
+from src import style
 from src.analyzer import Analyzer
+from src.style import fg
 from src.utils import color
 
+# 子命令、多人模式和可选功能的模块在使用时才导入，拖入日志进行分析时不必为它们付出启动时间。
+if TYPE_CHECKING:
+    from src.squad import PlayerLog
+    from src.stats_server import StatsState
+
 VERSION = 'v2.7.0'
+EXPORT_FORMATS = ['csv', 'jsonl', 'arrow', 'npy']  # 与 src.export.EXPORTERS 相同，避免解析参数时导入导出模块
 
 
 def error_msg():
@@ -23,94 +31,133 @@ def clear_console():
 
 class ConsoleOutputRedirector:
     def __init__(self):
-        self.buffer = StringIO()  # 缓存所有控制台输出
+        from src.squad import OUTPUT, OutputHistory, encode_output
+        self.history = OutputHistory()  # 缓存最近的控制台输出，每个字节有一个序号
+        self.output_kind = OUTPUT  # 在此绑定一次，每次输出时不必重新执行导入语句
+        self.encode_output = encode_output
         self.clients = []
+        self.lock = threading.Lock()  # 保证每个客机收到的输出既不重复也不遗漏
 
     def write(self, message):
         sys.__stdout__.write(message)  # 输出到主机的原始控制台
         sys.__stdout__.flush()
-        self.buffer.write(message)  # 将输出内容缓存
-        for conn in self.clients:  # 向所有连接的客机发送实时内容
-            try:
-                conn.sendall(message.encode('utf-8'))
-            except BrokenPipeError:
-                self.clients.remove(conn)
+        with self.lock:
+            offset, data = self.history.append(message)  # 将输出内容缓存
+            frame = self.encode_output(self.output_kind, offset, data)
+            for conn in list(self.clients):  # 向所有连接的客机发送实时内容
+                try:
+                    conn.sendall(frame)
+                except OSError:  # 断开或过慢的客机
+                    self.clients.remove(conn)
+                    self.shutdown(conn)
 
     def flush(self):
         sys.__stdout__.flush()
-        self.buffer.flush()
 
-    def add_client(self, conn):
-        self.clients.append(conn)
-        conn.sendall(self.buffer.getvalue().encode('utf-8'))  # 发送之前缓存的内容
+    def add_client(self, conn, cursor):
+        with self.lock:
+            conn.sendall(self.encode_output(*self.history.since(cursor)))  # 只发送客机错过的内容
+            self.clients.append(conn)
+
+    def remove_client(self, conn):
+        with self.lock:
+            if conn in self.clients:
+                self.clients.remove(conn)
 
+    @staticmethod
+    def shutdown(conn):
+        """
+        关闭连接的两个方向，但不关闭套接字本身。客机收到 EOF 后会重新连接并从游标补发错过的内容（超时的 sendall
+        可能只发送了半条消息，连接无法再使用）；主机随后读到 EOF，像普通断开一样注销并关闭连接。
+        """
+        import socket
+        try:
+            conn.shutdown(socket.SHUT_RDWR)
+        except OSError:  # 连接已经断开
+            pass
 
-def handle_client(conn, redirector):
-    redirector.add_client(conn)
-    try:
-        while True:
-            data = conn.recv(1024)
-            if not data:
-                break
-            sys.stdout.write(data.decode('utf-8', errors='replace'))
-            sys.stdout.flush()
-    except ConnectionAbortedError:
-        pass  # 忽略连接中断错误
-    finally:
-        conn.close()
-
-
-def start_server(redirector, port):
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_socket.bind(('', port))
-    server_socket.listen(5)
+
+def start_server(redirector, port, stats: Optional[StatsState] = None):
+    from src.squad import SquadHost, player_run_str
+
+    def publish(player: PlayerLog, run):
+        print(player_run_str(player.name, run))
+        if stats is not None:
+            stats.on_player_run(player, run)
+
+    host = SquadHost(port, redirector.add_client, redirector.remove_client, publish)
     print(f"服务器已启动，端口：{port}")
+    host.serve_forever()
 
-    while True:
-        conn, addr = server_socket.accept()
-        threading.Thread(target=handle_client, args=(conn, redirector)).start()
+
+def create_analyzer(args: argparse.Namespace) -> Analyzer:
+    history = None
+    if args.history:
+        from src.history import RunHistory
+        history = RunHistory(args.history)
+    analyzer = Analyzer(history=history, keep_runs=not args.quiet)
+    if args.export:
+        from src.export import create_exporter
+        for path in args.export:
+            try:
+                analyzer.listeners.append(create_exporter(path, args.export_format))
+            except ImportError as e:
+                sys.exit(str(e))
+    if args.http is not None:
+        from src.stats_server import start_stats_server
+        start_stats_server(analyzer, args.http)
+        print(f'HTTP 统计服务器已启动，端口：{args.http}')
+    return analyzer
 
 
-def host_mode():
+def host_mode(args: argparse.Namespace):
     clear_console()
     print("请使用内网穿透工具对此程序进行穿透")
     port = int(input('请输入端口号：'))
+    if args.http is None:
+        http_port = input('请输入 HTTP 统计端口（留空则不启用）：')
+        args.http = int(http_port) if http_port else None
     clear_console()
     redirector = ConsoleOutputRedirector()
     sys.stdout = redirector  # 重定向控制台输出到自定义的redirector
 
-    threading.Thread(target=start_server, args=(redirector, port), daemon=True).start()
-    Analyzer().run()
+    from src.squad import OutputCheckpoint
+    analyzer = create_analyzer(args)
+    analyzer.listeners.append(OutputCheckpoint(redirector.history))
+    stats = None
+    if args.http is not None:
+        from src.stats_server import StatsState
+        stats = next(listener for listener in analyzer.listeners if isinstance(listener, StatsState))
+    threading.Thread(target=start_server, args=(redirector, port, stats), daemon=True).start()
+    analyzer.run(args.log)
 
 
 def client_mode():
+    from src.squad import LogStreamer, run_client
+
     clear_console()
     host = input('请输入主机地址（格式：IP:PORT）：')
     clear_console()
     ip, port = host.split(':')
-    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    client_socket.connect((ip, int(port)))
-    print("已连接主机")
-
-    try:
-        while True:
-            data = client_socket.recv(1024)
-            if not data:
-                break
-            print(data.decode('utf-8', errors='replace'), end='')
-
-    finally:
-        client_socket.close()
+    streamer = None
+    if (log := Analyzer.default_log()) is not None and os.path.exists(log):
+        # 在后台跟随本地日志，只把与利润收割者相关的行发送给主机分析
+        streamer = LogStreamer(log)
+        threading.Thread(target=streamer.run, daemon=True).start()
+        print('将把本地 EE.log 中与利润收割者相关的行发送给主机。')
+    else:
+        print('未找到本地 EE.log，只显示主机的输出。')
+    run_client(ip, int(port), streamer)  # 连接断开时自动重新连接
 
 
-def multiplayer_mode():
+def multiplayer_mode(args: argparse.Namespace):
     clear_console()
     print("1. 主机模式")
     print("2. 客机模式")
     choice = input("请选择模式: ")
 
     if choice == '1':
-        host_mode()
+        host_mode(args)
     elif choice == '2':
         client_mode()
     else:
@@ -118,8 +165,103 @@ def multiplayer_mode():
         input('按 ENTER 退出..')
 
 
+def distill_mode(argv: list[str]):
+    from src.distiller import distill, default_output
+
+    parser = argparse.ArgumentParser(prog='ptanalyzer distill',
+                                     description='只保留 EE.log 中与利润收割者相关的行，生成可直接分析的精简日志。')
+    parser.add_argument('log', help='原始 EE.log 的路径')
+    parser.add_argument('-o', '--output', help='精简日志的输出路径（默认：<日志名>.ptd.log）')
+    parser.add_argument('--delta', action='store_true', help='以差值保存时间戳和偏移，使文件更小')
+    args = parser.parse_args(argv)
+
+    output = args.output or default_output(args.log)
+    stats = distill(args.log, output, delta=args.delta)
+    print(f'{fg.li_green}已将 {stats.lines} 行写入 {fg.li_cyan}{output}{fg.li_green} '
+          f'({stats.source_bytes} -> {stats.distilled_bytes} 字节，{stats.ratio:.2%})。')
+
+
+def history_mode(argv: list[str]):
+    from datetime import datetime
+    from src.history import RunHistory, HistoryFilter
+
+    parser = argparse.ArgumentParser(prog='ptanalyzer history', description='查询运行历史数据库。')
+    parser.add_argument('db', help='运行历史数据库的路径')
+    parser.add_argument('--nickname', help='只统计此玩家日志中记录的运行')
+    parser.add_argument('--player', action='append', default=[],
+                        help='只统计小队中包含此玩家的运行（可重复使用以指定整个小队）')
+    parser.add_argument('--days', type=float, help='只统计最近几天的运行')
+    parser.add_argument('--since', type=datetime.fromisoformat, help='只统计此日期（YYYY-MM-DD）之后的运行')
+    args = parser.parse_args(argv)
+
+    since = args.since.timestamp() if args.since else None
+    if args.days is not None:
+        since = max(since or 0.0, time.time() - args.days * 86400)
+    with RunHistory(args.db) as history:
+        history.print_report(HistoryFilter(args.nickname, args.player, since))
+
+
+def merge_mode(argv: list[str]):
+    from src.merge import align, merge_lines
+
+    parser = argparse.ArgumentParser(prog='ptanalyzer merge',
+                                     description='将同一小队多名队员的日志按共同事件对齐并合并为一条时间线后分析，'
+                                                 '一个日志中缺失的事件由其他日志补全。')
+    parser.add_argument('logs', nargs='+', metavar='log', help='要合并的日志（原始日志或精简日志），第一个为主日志')
+    parser.add_argument('-o', '--output', help='同时将合并后的日志写入此文件')
+    args = parser.parse_args(argv)
+
+    offsets = align(args.logs)
+    for path, offset in zip(args.logs[1:], offsets[1:]):
+        if offset is None:
+            print(f'{fg.li_red}{path} 中没有与主日志相同的锚点事件，已忽略。')
+        else:
+            print(f'{fg.li_grey}{path} 的时钟偏移：{offset:+.3f}s')
+
+    def write_through(lines, file):
+        for line in lines:
+            file.write(line)
+            yield line
+
+    analyzer = Analyzer()
+    recorded_at = os.stat(args.logs[0]).st_mtime
+    if args.output:
+        with open(args.output, 'w', encoding='latin-1', newline='') as output:
+            analyzer.analyze_lines(write_through(merge_lines(args.logs, offsets), output), recorded_at)
+    else:
+        analyzer.analyze_lines(merge_lines(args.logs, offsets), recorded_at)
+    analyzer.show_results()
+
+
+COMMANDS = {'distill': distill_mode, 'history': history_mode, 'merge': merge_mode}
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='ptanalyzer', description='利润收割者圆蛛分析器。',
+                                     epilog=f'其他命令：{", ".join(COMMANDS)}（使用 <命令> -h 查看帮助）')
+    parser.add_argument('log', nargs='?', help='要分析的日志；省略时以跟随模式打开 Warframe 的默认日志')
+    parser.add_argument('--history', metavar='DB', help='将有效运行保存到此 SQLite 运行历史数据库')
+    parser.add_argument('--export', metavar='PATH', action='append', default=[],
+                        help='在分析时将每次运行的结果导出到此文件（可重复使用）。格式由扩展名决定：'
+                             '.csv、.jsonl、.arrow（需要 pyarrow），其他路径导出为 .npy 目录')
+    parser.add_argument('--export-format', choices=EXPORT_FORMATS, help='忽略扩展名，以此格式导出')
+    parser.add_argument('--http', metavar='PORT', type=int,
+                        help='在此端口启动 HTTP 统计服务器（/state、/last、/summary 的 JSON 以及 /events 实时事件）')
+    parser.add_argument('--no-color', action='store_true',
+                        help='不输出颜色代码，也不加载颜色库（也可以设置环境变量 NO_COLOR）')
+    parser.add_argument('--quiet', action='store_true',
+                        help='分析日志时不逐个显示运行，也不在内存中保留运行（适用于导出大量运行）；跟随模式下不显示统计数据')
+    return parser.parse_args(argv)
+
+
 def main():
-    colorama.init()  # 使ANSI颜色工作。
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        style.init()  # 使ANSI颜色工作。
+        COMMANDS[sys.argv[1]](sys.argv[2:])
+        return
+    args = parse_args(sys.argv[1:])
+    style.init(color=not args.no_color)
+
     print(f'{fg.cyan}利润收割者圆蛛分析器 {VERSION} by {fg.li_cyan}ReVoltage#3425{fg.cyan}, 重写者 '
           f'{fg.li_cyan}Iterniam#5829{fg.cyan}, 翻译者'
           f'{fg.li_cyan} 小昕 [Q群:2941992901].')
@@ -131,9 +273,9 @@ def main():
 
     if choice == '1':
         clear_console()
-        Analyzer().run()  # 直接进入单人模式
+        create_analyzer(args).run(args.log)  # 直接进入单人模式
     elif choice == '2':
-        multiplayer_mode()
+        multiplayer_mode(args)
     else:
         print("无效选择，请重新启动程序。")
         input('按 ENTER 退出..')
@@ -1,49 +1,25 @@
+from __future__ import annotations
+
 import os
-import sys
 from collections import defaultdict
 from math import nan, isnan
-from statistics import median
-from time import sleep
-from typing import Iterator, Callable, Optional, Union
+from time import sleep, time as current_time
+from typing import Iterator, Callable, Optional, Union, TYPE_CHECKING
 
-from sty import rs, fg
+from src.style import rs, fg
 
+from src.constants import PTConstants, MiscConstants, RELEVANT_PATTERN, SHIELD_PHASE_ENDING_MARKERS
+from src.distiller import log_lines
 from src.enums.damage_types import DT
 from src.exceptions.bugged_run import BuggedRun
 from src.exceptions.log_end import LogEnd
 from src.exceptions.run_abort import RunAbort
+from src.listeners import RunEvent, RunListener
+from src.splits import SplitTracker
 from src.utils import color, time_str, oxfordcomma
 
-
-class PTConstants:
-    SHIELD_SWITCH = 'SwitchShieldVulnerability'  # 切换护盾
-    SHIELD_PHASE_ENDINGS = {1: 'GiveItem Queuing resource load for Transmission: '
-                               '/Lotus/Sounds/Dialog/FortunaOrbHeist/Business/DBntyFourInterPrTk0920TheBusiness',
-                            3: 'GiveItem Queuing resource load for Transmission: '
-                               '/Lotus/Sounds/Dialog/FortunaOrbHeist/Business/DBntyFourInterPrTk0890TheBusiness',
-                            4: 'GiveItem Queuing resource load for Transmission: '
-                               '/Lotus/Sounds/Dialog/FortunaOrbHeist/Business/DBntyFourSatelReal0930TheBusiness'}
-    LEG_KILL = 'Leg freshly destroyed at part'  # 腿部刚被摧毁
-    BODY_VULNERABLE = 'Camper->StartVulnerable() - The Camper can now be damaged!'  # 身体变得脆弱
-    STATE_CHANGE = 'CamperHeistOrbFight.lua: Landscape - New State: '  # 状态改变
-    PYLONS_LAUNCHED = 'Pylon launch complete'  # 支柱发射完成
-    PHASE_1_START = 'Orb Fight - Starting first attack Orb phase'  # 第一阶段开始
-    PHASE_ENDS = {1: 'Orb Fight - Starting second attack Orb phase',  # 第一阶段结束
-                  2: 'Orb Fight - Starting third attack Orb phase',  # 第二阶段结束
-                  3: 'Orb Fight - Starting final attack Orb phase',  # 第三阶段结束
-                  4: ''}  # 第四阶段结束
-    FINAL_PHASE = 4  # 最终阶段
-
-
-class MiscConstants:
-    NICKNAME = 'Net [Info]: name: '  # 昵称
-    SQUAD_MEMBER = 'loadout loader finished.'  # 小队成员
-    HEIST_START = 'jobId=/Lotus/Types/Gameplay/Venus/Jobs/Heists/HeistProfitTakerBountyFour'  # 抢劫开始
-    HOST_MIGRATION = '"jobId" : "/Lotus/Types/Gameplay/Venus/Jobs/Heists/HeistProfitTakerBountyFour'  # 主机迁移
-    HEIST_ABORT = 'SetReturnToLobbyLevelArgs: '  # 抢劫中止
-    ELEVATOR_EXIT = 'EidolonMP.lua: EIDOLONMP: Avatar left the zone'  # 电梯出口
-    BACK_TO_TOWN = 'EidolonMP.lua: EIDOLONMP: TryTownTransition'  # 返回城镇
-    ABORT_MISSION = 'GameRulesImpl - changing state from SS_STARTED to SS_ENDING'  # 中止任务
+if TYPE_CHECKING:
+    from src.history import RunHistory
 
 
 class RelRun:
@@ -303,40 +279,68 @@ class AbsRun:
 
 class Analyzer:
 
-    def __init__(self):
+    def __init__(self, history: Optional[RunHistory] = None, keep_runs: bool = True):
         self.follow_mode = False
         self.runs: list[Union[RelRun, RunAbort, BuggedRun]] = []
         self.proper_runs: list[RelRun] = []
+        self.run_count = 0  # 包括中止和出错的运行
+        self.history = history  # 可选的持久运行历史
+        self.listeners: list[RunListener] = []
+        self.keep_runs = keep_runs  # 为 False 时运行只交给历史记录和监听器，分析日志时内存占用与运行数量无关
 
-    def run(self):
-        filename = self.get_file()
-        if self.follow_mode:
-            self.follow_log(filename)
-        else:
-            self.analyze_log(filename)
-
-    def get_file(self) -> str:
+    def run(self, filename: Optional[str] = None):
+        filename = self.get_file(filename)
         try:
+            if self.follow_mode:
+                self.follow_log(filename)
+            else:
+                self.analyze_log(filename)
+        finally:
+            self.close_listeners()
+
+    def close_listeners(self) -> None:
+        listeners, self.listeners = self.listeners, []
+        for listener in listeners:
+            listener.close()
+
+    def get_file(self, filename: Optional[str] = None) -> str:
+        if filename is not None:
             self.follow_mode = False
-            return sys.argv[1]
-        except IndexError:
+            return filename
+        else:
             print(fr"{fg.li_grey}正在以跟随模式打开 Warframe 的默认日志 %LOCALAPPDATA%/Warframe/EE.log。")
             print('跟随模式意味着运行将在你玩游戏时显示。 '
                   '利润收割者圆蛛 出现时也会打印第一个护盾。')
             print('请注意，你可以通过将文件拖到 exe 文件中来分析其他文件。')
             self.follow_mode = True
-            try:
-                return os.getenv('LOCALAPPDATA') + r'/Warframe/EE.log'
-            except TypeError:
+            if (filename := Analyzer.default_log()) is not None:
+                return filename
+            else:
                 print(f'{fg.li_red}你好 Linux 用户！请查阅 github.com/revoltage34/ptanalyzer 或 '
                       f'idalon.com/pt 上的README，以了解如何使跟随模式正常工作。')
                 print(f'{rs.fg}按 ENTER 退出...')
                 input()  # input(prompt) 不支持颜色编码，因此我们将其与打印分开。
                 exit(-1)
 
+    @staticmethod
+    def default_log() -> Optional[str]:
+        """返回 Warframe 默认日志的路径。没有 %LOCALAPPDATA% 时（例如 Linux）返回 None。"""
+        if (local_appdata := os.getenv('LOCALAPPDATA')) is None:
+            return None
+        return local_appdata + r'/Warframe/EE.log'
+
     @staticmethod
     def follow(filename: str):
         """生成器函数，用于生成文件中的新行"""
+        for lines in Analyzer.follow_batches(filename):
+            yield from lines
+
+    @staticmethod
+    def follow_batches(filename: str, max_lines: int = 1000):
+        """
+        生成器函数，每次轮询文件时生成读到的完整行的列表（最多 ``max_lines`` 行）。
+        文件中没有新行时生成空列表，使调用者可以在等待期间处理超时。
+        """
         known_size = os.stat(filename).st_size
         with open(filename, 'r', encoding='latin-1') as file:
             # 开始无限循环
@@ -348,33 +352,60 @@ class Analyzer:
                     print('成功重新连接到 ee.log。现在监听新的 利润收割者圆蛛 运行。')
                 known_size = new_size
 
-                # 生成文件中的最后一行，并在延迟时跟随末尾
+                # 生成文件中的最后几行，并在延迟时跟随末尾
+                lines = []
                 while line := file.readline():
                     cur_line.append(line)  # 存储找到的内容。
                     if line[-1] == '\n':  # 遇到换行符，提交行
-                        yield ''.join(cur_line)
+                        lines.append(''.join(cur_line))
                         cur_line = []
+                        if len(lines) >= max_lines:
+                            yield lines
+                            lines = []
+                yield lines
                 # 文件中没有更多行 - 等待更多输入，然后再生成它。
                 sleep(.1)
 
     def analyze_log(self, dropped_file: str):
-        with open(dropped_file, 'r', encoding='latin-1') as it:
-            try:
-                require_heist_start = True
-                while True:
-                    try:
-                        run = self.read_run(it, len(self.runs) + 1, require_heist_start).to_rel()
-                        self.runs.append(run)
-                        self.proper_runs.append(run)
-                        require_heist_start = True
-                    except RunAbort as abort:
-                        self.runs.append(abort)
-                        require_heist_start = abort.require_heist_start
-                    except BuggedRun as buggedRun:
-                        self.runs.append(buggedRun)
-                        require_heist_start = True
-            except LogEnd:
-                pass
+        recorded_at = os.stat(dropped_file).st_mtime  # 历史记录中使用日志的修改时间作为运行日期
+        with open(dropped_file, 'r', encoding='latin-1') as file:
+            self.analyze_lines(log_lines(file), recorded_at)  # 同时接受原始日志和精简日志
+        self.show_results()
+
+    def analyze_lines(self, it: Iterator[str], recorded_at: float) -> None:
+        """
+        读取日志的所有运行并记录它们的结果。
+
+        :param it: 日志行的迭代器。
+        :param recorded_at: 运行的 Unix 时间，用于历史记录。
+        """
+        try:
+            require_heist_start = True
+            while True:
+                try:
+                    run = self.read_run(it, self.run_count + 1, require_heist_start).to_rel()
+                    self.record_run(run, recorded_at)
+                    require_heist_start = True
+                except RunAbort as abort:
+                    self.record_run(abort, recorded_at)
+                    require_heist_start = abort.require_heist_start
+                except BuggedRun as buggedRun:
+                    self.record_run(buggedRun, recorded_at)
+                    require_heist_start = True
+        except LogEnd:
+            pass
+
+    def show_results(self) -> None:
+        """完成历史记录和导出，然后显示所有已分析的运行和统计数据，并等待用户按键退出。"""
+        if self.history is not None:
+            self.history.flush()
+        self.close_listeners()  # 在等待用户按键之前完成导出文件
+
+        if not self.keep_runs:
+            print(f'{fg.white}共分析了 {self.run_count} 次运行。')
+            print(f'{rs.fg}按 ENTER 退出...')
+            input()
+            return
 
         # 确定最佳运行
         if len(self.proper_runs) > 0:
@@ -400,29 +431,53 @@ class Analyzer:
 
     def follow_log(self, filename: str):
         it = Analyzer.follow(filename)
+        self.listeners.append(SplitTracker())  # 实时显示与最佳运行的分段对比
         best_time = float('inf')
         require_heist_start = True
         while True:
             try:
-                run = self.read_run(it, len(self.runs) + 1, require_heist_start).to_rel()
-                self.runs.append(run)
-                self.proper_runs.append(run)
+                run = self.read_run(it, self.run_count + 1, require_heist_start).to_rel()
+                self.record_run(run, current_time())
+                if self.history is not None:
+                    self.history.flush()
                 require_heist_start = True
 
                 if run.length < best_time:
                     best_time = run.length
                     run.best_run_yet = True
                 run.pretty_print()
-                self.print_summary()
+                if self.keep_runs:  # --quiet 时不保留运行，也就没有统计数据
+                    self.print_summary()
             except RunAbort as abort:
                 print(abort)
-                self.runs.append(abort)
+                self.record_run(abort, current_time())
                 require_heist_start = abort.require_heist_start
             except BuggedRun as buggedRun:
                 print(buggedRun)  # 打印运行失败的原因
-                self.runs.append(buggedRun)
+                self.record_run(buggedRun, current_time())
                 require_heist_start = True
 
+    def record_run(self, run: Union[RelRun, RunAbort, BuggedRun], recorded_at: float) -> None:
+        """
+        记录一次运行的结果，将有效运行加入历史记录，并通知所有监听器。\n
+        :param run: 运行的结果。
+        :param recorded_at: 运行的 Unix 时间，用于历史记录。
+        """
+        self.run_count += 1
+        if self.keep_runs:
+            self.runs.append(run)
+        if isinstance(run, RelRun):
+            if self.keep_runs:
+                self.proper_runs.append(run)
+            if self.history is not None:
+                self.history.add(run, recorded_at)
+        for listener in self.listeners:
+            listener.on_run(run)
+
+    def notify(self, run: AbsRun, event: str, phase: int, time: float) -> None:
+        for listener in self.listeners:
+            listener.on_event(run, event, phase, time)
+
     def read_run(self, log: Iterator[str], run_nr: int, require_heist_start=False) -> AbsRun:
         """
         读取运行。
@@ -457,26 +512,36 @@ class Analyzer:
                 line = next(log)
             except StopIteration:
                 raise LogEnd()
+            if not RELEVANT_PATTERN.search(line):  # 绝大多数行不包含任何标记，一次搜索即可跳过
+                continue
 
             # 检查 PT 特定消息
             if PTConstants.SHIELD_SWITCH in line:  # 护盾切换
                 # 护盾阶段 '3.5' 用于阶段 3 中支柱阶段期间护盾切换的情况。
                 shield_phase = 3.5 if phase == 3 and 3 in run.pylon_start else phase
                 run.shield_phases[shield_phase].append(Analyzer.shield_from_line(line))
+                if self.listeners:
+                    self.notify(run, RunEvent.SHIELD_SWITCH, phase, run.shield_phases[shield_phase][-1][1])
 
                 # 第一个护盾可以帮助确定是否中止。
                 if self.follow_mode and len(run.shield_phases[1]) == 1:
                     print(f'{fg.white}第一个护盾: {fg.li_cyan}{run.shield_phases[phase][0][0]}')
-            elif any(True for shield_end in PTConstants.SHIELD_PHASE_ENDINGS.values() if shield_end in line):
+            elif any(shield_end in line for shield_end in SHIELD_PHASE_ENDING_MARKERS):
                 run.shield_phase_endings[phase] = Analyzer.time_from_line(line)
+                if self.listeners:
+                    self.notify(run, RunEvent.SHIELDS_DONE, phase, run.shield_phase_endings[phase])
             elif PTConstants.LEG_KILL in line:  # 腿部摧毁
                 run.legs[phase].append(Analyzer.time_from_line(line))
+                if self.listeners:
+                    self.notify(run, RunEvent.LEG_KILL, phase, run.legs[phase][-1])
             elif PTConstants.BODY_VULNERABLE in line:  # 身体脆弱 / 阶段 4 结束
                 if kill_sequence == 0:  # 每个阶段只注册第一次无敌消息
                     run.body_vuln[phase] = Analyzer.time_from_line(line)
                 kill_sequence += 1  # 一个阶段中有 3 次 BODY_VULNERABLE 意味着 PT 死亡。
                 if kill_sequence == 3:  # PT 死亡。
                     run.body_kill[phase] = Analyzer.time_from_line(line)
+                    if self.listeners:
+                        self.notify(run, RunEvent.BODY_KILL, phase, run.body_kill[phase])
                     return
             elif PTConstants.STATE_CHANGE in line:  # 通用状态变化
                 # 在状态变化上进行通用匹配，以查找我们无法可靠找到的其他内容
@@ -484,6 +549,8 @@ class Analyzer:
                 # 状态 3、5 和 6 是阶段 1、2 和 3 的身体击杀。
                 if new_state in [3, 5, 6]:
                     run.body_kill[phase] = Analyzer.time_from_line(line)
+                    if self.listeners:
+                        self.notify(run, RunEvent.BODY_KILL, phase, run.body_kill[phase])
             elif PTConstants.PYLONS_LAUNCHED in line:  # 支柱发射完成
                 run.pylon_start[phase] = Analyzer.time_from_line(line)
             elif PTConstants.PHASE_1_START in line:  # 利润收割者圆蛛 发现
@@ -491,6 +558,8 @@ class Analyzer:
             elif PTConstants.PHASE_ENDS[phase] in line and phase != PTConstants.FINAL_PHASE:  # 阶段结束，除第 4 阶段外
                 if phase in [1, 3]:  # 忽略阶段 2，因为它已匹配 body_kill。
                     run.pylon_end[phase] = Analyzer.time_from_line(line)
+                if self.listeners:
+                    self.notify(run, RunEvent.PHASE_END, phase, Analyzer.time_from_line(line))
                 return
             else:
                 pt_line_match = False
@@ -527,32 +596,42 @@ class Analyzer:
 
     @staticmethod
     def skip_until_one_of(log: Iterator[str], conditions: list[Callable[[str], bool]]) -> tuple[str, int]:
-        try:
-            line = next(log)
-            while not any((condition(line) for condition in conditions)):  # 跳过直到满足任一条件
-                line = next(log)
-            return line, next((i for i, cond in enumerate(conditions) if cond(line)))  # 返回第一个通过的索引
-        except StopIteration:
-            raise LogEnd()
+        for line in log:  # 跳过直到满足任一条件
+            for i, condition in enumerate(conditions):
+                if condition(line):
+                    return line, i  # 返回第一个通过的索引
+        raise LogEnd()
+
+    def summary(self) -> dict[str, Union[RelRun, float]]:
+        """返回 ``print_summary`` 显示的统计数据：最佳运行以及各项时间的中位数。"""
+        from statistics import median  # 只在显示统计数据时需要，不在启动时导入
+        assert len(self.proper_runs) > 0
+        return {'best_run': min(self.proper_runs, key=lambda run: run.length),
+                'length': median(run.length for run in self.proper_runs),
+                'fight': median(run.length - run.pt_found for run in self.proper_runs),
+                'sum_of_parts': median(run.sum_of_parts for run in self.proper_runs),
+                'shield_sum': median(run.shield_sum for run in self.proper_runs),
+                'leg_sum': median(run.leg_sum for run in self.proper_runs),
+                'body_sum': median(run.body_sum for run in self.proper_runs),
+                'pylon_sum': median(run.pylon_sum for run in self.proper_runs)}
 
     def print_summary(self):
-        assert len(self.proper_runs) > 0
-        best_run = min(self.proper_runs, key=lambda run: run.length)
+        summary = self.summary()
+        best_run = summary['best_run']
         print(f'{fg.li_green}最佳运行:\t\t'
               f'{fg.li_cyan}{time_str(best_run.length, "units")} '
               f'{fg.cyan}(第 {best_run.run_nr} 次运行)')
         print(f'{fg.li_green}中间时间:\t\t'
-              f'{fg.li_cyan}{time_str(median(run.length for run in self.proper_runs), "units")}')
+              f'{fg.li_cyan}{time_str(summary["length"], "units")}')
         print(f'{fg.li_green}中间战斗持续时间:\t'
-              f'{fg.li_cyan}{time_str(median(run.length - run.pt_found for run in self.proper_runs), "units")}\n')
+              f'{fg.li_cyan}{time_str(summary["fight"], "units")}\n')
         print(f'{fg.li_green}各部分中间数总和 {fg.li_cyan}'
-              f'{time_str(median(run.sum_of_parts for run in self.proper_runs), "brackets")}')
+              f'{time_str(summary["sum_of_parts"], "brackets")}')
         print(f'{fg.white} 中间护盾切换:\t{fg.li_green}'
-              f'{median(run.shield_sum for run in self.proper_runs):7.3f}s')
+              f'{summary["shield_sum"]:7.3f}s')
         print(f'{fg.white} 中间腿部破坏:\t{fg.li_green}'
-              f'{median(run.leg_sum for run in self.proper_runs):7.3f}s')
+              f'{summary["leg_sum"]:7.3f}s')
         print(f'{fg.white} 中间身体击杀:\t{fg.li_green}'
-              f'{median(run.body_sum for run in self.proper_runs):7.3f}s')
+              f'{summary["body_sum"]:7.3f}s')
         print(f'{fg.white} 中间支柱:\t\t{fg.li_green}'
-              f'{median(run.pylon_sum for run in self.proper_runs):7.3f}s')
-
+              f'{summary["pylon_sum"]:7.3f}s')
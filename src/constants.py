@@ -0,0 +1,58 @@
+import re
+
+
+class PTConstants:
+    SHIELD_SWITCH = 'SwitchShieldVulnerability'  # 切换护盾
+    SHIELD_PHASE_ENDINGS = {1: 'GiveItem Queuing resource load for Transmission: '
+                               '/Lotus/Sounds/Dialog/FortunaOrbHeist/Business/DBntyFourInterPrTk0920TheBusiness',
+                            3: 'GiveItem Queuing resource load for Transmission: '
+                               '/Lotus/Sounds/Dialog/FortunaOrbHeist/Business/DBntyFourInterPrTk0890TheBusiness',
+                            4: 'GiveItem Queuing resource load for Transmission: '
+                               '/Lotus/Sounds/Dialog/FortunaOrbHeist/Business/DBntyFourSatelReal0930TheBusiness'}
+    LEG_KILL = 'Leg freshly destroyed at part'  # 腿部刚被摧毁
+    BODY_VULNERABLE = 'Camper->StartVulnerable() - The Camper can now be damaged!'  # 身体变得脆弱
+    STATE_CHANGE = 'CamperHeistOrbFight.lua: Landscape - New State: '  # 状态改变
+    PYLONS_LAUNCHED = 'Pylon launch complete'  # 支柱发射完成
+    PHASE_1_START = 'Orb Fight - Starting first attack Orb phase'  # 第一阶段开始
+    PHASE_ENDS = {1: 'Orb Fight - Starting second attack Orb phase',  # 第一阶段结束
+                  2: 'Orb Fight - Starting third attack Orb phase',  # 第二阶段结束
+                  3: 'Orb Fight - Starting final attack Orb phase',  # 第三阶段结束
+                  4: ''}  # 第四阶段结束
+    FINAL_PHASE = 4  # 最终阶段
+
+
+class MiscConstants:
+    NICKNAME = 'Net [Info]: name: '  # 昵称
+    SQUAD_MEMBER = 'loadout loader finished.'  # 小队成员
+    HEIST_START = 'jobId=/Lotus/Types/Gameplay/Venus/Jobs/Heists/HeistProfitTakerBountyFour'  # 抢劫开始
+    HOST_MIGRATION = '"jobId" : "/Lotus/Types/Gameplay/Venus/Jobs/Heists/HeistProfitTakerBountyFour'  # 主机迁移
+    HEIST_ABORT = 'SetReturnToLobbyLevelArgs: '  # 抢劫中止
+    ELEVATOR_EXIT = 'EidolonMP.lua: EIDOLONMP: Avatar left the zone'  # 电梯出口
+    BACK_TO_TOWN = 'EidolonMP.lua: EIDOLONMP: TryTownTransition'  # 返回城镇
+    ABORT_MISSION = 'GameRulesImpl - changing state from SS_STARTED to SS_ENDING'  # 中止任务
+
+
+# 护盾阶段结束的所有标记，逐行检查时不必每次都构建字典视图。
+SHIELD_PHASE_ENDING_MARKERS: tuple[str, ...] = tuple(PTConstants.SHIELD_PHASE_ENDINGS.values())
+
+# 分析器会响应的所有标记。不包含其中任何一个标记的行不会影响分析结果，可以安全地跳过。
+RELEVANT_MARKERS: tuple[str, ...] = (
+    PTConstants.SHIELD_SWITCH,
+    *SHIELD_PHASE_ENDING_MARKERS,
+    PTConstants.LEG_KILL,
+    PTConstants.BODY_VULNERABLE,
+    PTConstants.STATE_CHANGE,
+    PTConstants.PYLONS_LAUNCHED,
+    PTConstants.PHASE_1_START,
+    *(marker for marker in PTConstants.PHASE_ENDS.values() if marker),
+    MiscConstants.NICKNAME,
+    MiscConstants.SQUAD_MEMBER,
+    MiscConstants.HEIST_START,
+    MiscConstants.HOST_MIGRATION,
+    MiscConstants.HEIST_ABORT,
+    MiscConstants.ELEVATOR_EXIT,
+    MiscConstants.BACK_TO_TOWN,
+    MiscConstants.ABORT_MISSION,
+)
+# 一次性匹配任一标记的正则表达式。
+RELEVANT_PATTERN = re.compile('|'.join(re.escape(marker) for marker in RELEVANT_MARKERS))
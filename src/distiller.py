@@ -0,0 +1,149 @@
+import os
+import re
+from typing import Iterator, TextIO, Iterable
+
+from src.constants import RELEVANT_PATTERN
+
+MAGIC = '#ptdistill'  # 精简日志第一行的开头
+FORMAT_VERSION = 1
+CHUNK_SIZE = 8 * 1024 * 1024  # 每次从原始日志读取的字节数
+
+# 精简日志只对能够无损还原的时间戳（无前导零、恰好三位小数）进行编码，其余行原样保存。
+_TIMESTAMP = re.compile(rb'(0|[1-9]\d*)\.(\d{3})(?=\s)')
+_LINE_BREAK = re.compile(rb'[\r\n]')
+
+
+class DistillStats:
+
+    def __init__(self, source_bytes: int, lines: int, distilled_bytes: int):
+        self.source_bytes = source_bytes
+        self.lines = lines
+        self.distilled_bytes = distilled_bytes
+
+    @property
+    def ratio(self) -> float:
+        return self.distilled_bytes / self.source_bytes if self.source_bytes else 0.0
+
+
+def scan_relevant(filename: str, chunk_size: int = CHUNK_SIZE) -> Iterator[tuple[int, bytes]]:
+    """
+    只扫描一次日志，返回所有包含相关标记的行。\n
+    按大块读取文件并直接在块上搜索标记，因此绝大多数无关行从未被单独处理。
+    行的划分与以文本模式读取日志时相同（\\n、\\r\\n 和 \\r 都视为换行）。\n
+    :param filename: 原始 EE.log 的路径。
+    :param chunk_size: 每次读取的字节数。
+    :return: (行在源文件中的字节偏移, 不含换行符的行内容) 的迭代器。
+    """
+    # 字节版本只在扫描原始日志时需要，不在导入时编译。日志以 latin-1 解码，因此两个版本逐字符对应。
+    pattern = re.compile(RELEVANT_PATTERN.pattern.encode('latin-1'))
+    with open(filename, 'rb') as file:
+        base = 0  # buffer[0] 在源文件中的偏移
+        buffer = b''
+        while True:
+            chunk = file.read(chunk_size)
+            buffer += chunk
+            if chunk:
+                # 只处理到最后一个完整行为止，剩余部分与下一块拼接。
+                cut = buffer.rfind(b'\n') + 1
+                if cut == 0:
+                    continue
+            else:
+                cut = len(buffer)
+
+            pos = 0
+            while match := pattern.search(buffer, pos, cut):
+                newline = buffer.rfind(b'\n', pos, match.start())
+                start = max(newline, buffer.rfind(b'\r', newline + 1, match.start())) + 1
+                line_break = _LINE_BREAK.search(buffer, match.end(), cut)
+                end = line_break.start() if line_break else cut
+                yield base + start, buffer[start:end]
+                pos = end
+
+            if not chunk:
+                return
+            base += cut
+            buffer = buffer[cut:]
+
+
+def distill(source: str, target: str, delta: bool = False) -> DistillStats:
+    """
+    将 ``source`` 中与利润收割者相关的行写入精简日志 ``target``。\n
+    每行记录其在源文件中的字节偏移以及原始时间戳。``delta`` 为 True 时，偏移和时间戳（以毫秒计）
+    都以与上一行的差值保存，使文件更小。\n
+    :param source: 原始 EE.log 的路径。
+    :param target: 精简日志的输出路径。
+    :param delta: 是否对偏移和时间戳进行差分编码。
+    :return: 关于精简结果的统计信息。
+    """
+    lines = 0
+    prev_offset = 0
+    prev_ms = 0
+    with open(target, 'wb') as out:
+        header = f'{MAGIC} {FORMAT_VERSION} delta={int(delta)} source={os.path.basename(source)}\n'
+        out.write(header.encode('latin-1', errors='replace'))
+        for offset, line in scan_relevant(source):
+            if match := _TIMESTAMP.match(line):
+                ms = int(match[1]) * 1000 + int(match[2])
+                rest = line[match.end():]
+                if delta:
+                    timestamp = str(ms - prev_ms).encode()
+                    prev_ms = ms
+                else:
+                    timestamp = match[0]
+            else:  # 无法编码的时间戳：将整行原样保存。
+                timestamp, rest = b'-', line
+            out.write(b'%d\t%s\t%s\n' % (offset - prev_offset if delta else offset, timestamp, rest))
+            if delta:
+                prev_offset = offset
+            lines += 1
+        distilled_bytes = out.tell()
+    return DistillStats(os.stat(source).st_size, lines, distilled_bytes)
+
+
+def is_distilled(first_line: str) -> bool:
+    return first_line.startswith(MAGIC + ' ')
+
+
+def read_distilled(lines: Iterable[str]) -> Iterator[tuple[int, str]]:
+    """
+    还原精简日志。\n
+    :param lines: 精简日志的行，包括第一行的文件头。
+    :return: (源文件中的字节偏移, 原始行) 的迭代器。原始行以换行符结尾。
+    :raise ValueError: 文件头不是受支持的精简日志格式。
+    """
+    lines = iter(lines)
+    header = next(lines, '')
+    fields = dict(field.split('=', 1) for field in header.split(' ', 3)[2:] if '=' in field)
+    if not is_distilled(header) or header.split(' ', 2)[1] != str(FORMAT_VERSION):
+        raise ValueError(f'不支持的精简日志格式：{header.strip()}')
+    delta = fields.get('delta') == '1'
+
+    offset = 0
+    ms = 0
+    for record in lines:
+        offset_str, timestamp, rest = record.split('\t', 2)
+        offset = offset + int(offset_str) if delta else int(offset_str)
+        if timestamp == '-':
+            yield offset, rest
+            continue
+        if delta:
+            ms += int(timestamp)
+            timestamp = f'{ms // 1000}.{ms % 1000:03d}'
+        yield offset, timestamp + rest
+
+
+def log_lines(file: TextIO) -> Iterator[str]:
+    """
+    返回日志文件的行。如果 ``file`` 是精简日志，则还原其原始行，否则逐行返回文件内容。\n
+    :param file: 以 latin-1 编码的文本模式打开的日志文件。
+    """
+    distilled = is_distilled(file.readline())
+    file.seek(0)
+    if distilled:
+        return (line for _, line in read_distilled(file))
+    return iter(file)
+
+
+def default_output(source: str) -> str:
+    root, _ = os.path.splitext(source)
+    return root + '.ptd.log'
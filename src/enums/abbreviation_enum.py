@@ -1,19 +1,26 @@
 from __future__ import annotations
 
+from enum import Enum
 from typing import TypeVar, Type, Optional
-from aenum import MultiValueEnum
 
 _T = TypeVar('_T')
 
 
-class AbbreviationEnum(MultiValueEnum):
+class AbbreviationEnum(Enum):
     """
-    为 ``MultiValueEnum`` 添加了一个 ``from_str`` 方法，允许将任何字符串多值映射到相应的
-    枚举（不区分大小写）。
+    每个成员有多个字符串值的枚举，第一个值为 ``value``，所有值保存在 ``values`` 中。
+    添加了一个 ``from_str`` 方法，允许将任何字符串多值映射到相应的枚举（不区分大小写）。\n
+    基于标准库的 ``Enum``，而不是 aenum 的 ``MultiValueEnum``，以减少启动时的导入时间。
 
     重写了字符串 Dunder 方法，以显示值而不是枚举。
     """
 
+    def __new__(cls, *values: str):
+        member = object.__new__(cls)
+        member._value_ = values[0]
+        member.values = values
+        return member
+
     def __str__(self):
         return str(self.value)
 
@@ -25,12 +32,18 @@ class AbbreviationEnum(MultiValueEnum):
         :param default: 如果没有匹配的枚举，则返回的默认值。
         :return: 如果存在，与名称对应的枚举，否则返回默认值。
         """
-        name = name.casefold()
-        for enum_instance in iter(cls):
-            for abbreviation in enum_instance.values:
-                if name == abbreviation.casefold():
-                    return enum_instance
-        return default
+        return cls._abbreviations().get(name.casefold(), default)
+
+    @classmethod
+    def _abbreviations(cls) -> dict[str, AbbreviationEnum]:
+        """所有值（casefold 后）到枚举的查找表，每个类只构建一次。"""
+        if '_abbreviation_table' not in cls.__dict__:
+            table = {}
+            for enum_instance in iter(cls):
+                for abbreviation in enum_instance.values:
+                    table.setdefault(abbreviation.casefold(), enum_instance)  # 与按顺序查找时的第一个匹配相同
+            cls._abbreviation_table = table
+        return cls.__dict__['_abbreviation_table']
 
     @classmethod
     def regex_match_any(cls) -> str:
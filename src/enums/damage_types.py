@@ -33,5 +33,8 @@ class DT(AbbreviationEnum):
         :param name: 匹配的内部名称。
         :return: 如果存在，与名称对应的枚举，否则返回默认值 None。
         """
-        return next((enum_instance for enum_instance in iter(DT) if name == enum_instance.internal_name),
-                    None)
+        return _BY_INTERNAL_NAME.get(name)
+
+
+# 每条护盾切换行都要查找一次，因此在导入时构建查找表。
+_BY_INTERNAL_NAME: dict[str, DT] = {enum_instance.internal_name: enum_instance for enum_instance in DT}
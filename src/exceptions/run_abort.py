@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 
-from sty import fg
+from src.style import fg
 
 from src.utils import time_str
 
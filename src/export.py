@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import csv
+import json
+import os
+import struct
+import sys
+from array import array
+from math import nan, isnan
+from typing import TYPE_CHECKING, Union, Optional
+
+from src.exceptions.bugged_run import BuggedRun
+from src.exceptions.run_abort import RunAbort
+from src.listeners import RunListener
+
+if TYPE_CHECKING:
+    from src.analyzer import RelRun
+
+PHASES = [1, 2, 3, 4]
+OUTCOMES = {'cleared': 0, 'aborted': 1, 'bugged': 2}
+STRING_COLUMNS = ['outcome', 'nickname', 'squad']
+NUMERIC_COLUMNS = ['length', 'pt_found', 'shield_sum', 'leg_sum', 'body_sum', 'pylon_sum',
+                   *(f'p{phase}_{part}' for phase in PHASES for part in ['duration', 'shields', 'legs', 'body', 'pylon'])]
+COLUMNS = ['run_nr', *STRING_COLUMNS, *NUMERIC_COLUMNS]
+
+
+def run_row(run: Union[RelRun, RunAbort, BuggedRun]) -> dict:
+    """
+    将运行的结果展开为一行。中止或出错的运行只有编号、结果类型和玩家，时间均为 nan。\n
+    每个阶段的护盾和腿部时间为该阶段的总和。没有护盾阶段或支柱阶段的阶段，相应的时间为 nan。
+    """
+    if isinstance(run, (RunAbort, BuggedRun)):
+        outcome, rel_run, run = 'aborted' if isinstance(run, RunAbort) else 'bugged', None, run.run
+    else:
+        outcome, rel_run = 'cleared', run
+    row = {'run_nr': run.run_nr, 'outcome': outcome, 'nickname': run.nickname,
+           'squad': ';'.join(sorted(name for name in run.squad_members | {run.nickname} if name))}
+    if rel_run is None:
+        row.update(dict.fromkeys(NUMERIC_COLUMNS, nan))
+        return row
+
+    row.update({'length': rel_run.length, 'pt_found': rel_run.pt_found, 'shield_sum': rel_run.shield_sum,
+                'leg_sum': rel_run.leg_sum, 'body_sum': rel_run.body_sum, 'pylon_sum': rel_run.pylon_sum})
+    for phase in PHASES:
+        row[f'p{phase}_duration'] = rel_run.phase_durations[phase]
+        row[f'p{phase}_shields'] = sum(time for _, time in rel_run.shield_phases[phase] if not isnan(time)) \
+            if phase in rel_run.shield_phases else nan
+        row[f'p{phase}_legs'] = sum(rel_run.legs[phase])
+        row[f'p{phase}_body'] = rel_run.body_dur[phase]
+        row[f'p{phase}_pylon'] = rel_run.pylon_dur.get(phase, nan)
+    return row
+
+
+def run_record(run: Union[RelRun, RunAbort, BuggedRun]) -> dict:
+    """
+    返回可序列化为 JSON 的运行结果。除了 ``run_row`` 的列之外，有效运行还包含每个护盾和每条腿的时间。
+    nan 表示为 None，时间保留到毫秒。
+    """
+    record = {column: None if isinstance(value, float) and isnan(value) else
+              round(value, 3) if isinstance(value, float) else value
+              for column, value in run_row(run).items()}
+    if not isinstance(run, (RunAbort, BuggedRun)):
+        record['shields'] = {str(phase): [[str(shield), None if isnan(time) else round(time, 3)]
+                                          for shield, time in shields]
+                             for phase, shields in run.shield_phases.items()}
+        record['legs'] = {str(phase): [round(time, 3) for time in legs] for phase, legs in run.legs.items()}
+    return record
+
+
+class RunExporter(RunListener):
+    """
+    以流的方式导出分析器产生的每个运行结果。导出器不保留已写入的运行，因此内存占用与运行数量无关。\n
+    作为 ``RunListener`` 添加到 ``Analyzer.listeners`` 中，分析器在分析结束时调用 ``close``。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+
+    def on_run(self, run: Union[RelRun, RunAbort, BuggedRun]) -> None:
+        self.write(run)
+        self.count += 1
+
+    def write(self, run: Union[RelRun, RunAbort, BuggedRun]) -> None:
+        """写入一个运行结果。与 ``RunListener`` 的方法一样，默认实现不做任何事，由子类覆盖。"""
+        pass
+
+
+class CsvExporter(RunExporter):
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.file = open(path, 'w', encoding='utf-8', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(COLUMNS)
+
+    def write(self, run: Union[RelRun, RunAbort, BuggedRun]) -> None:
+        row = run_row(run)
+        self.writer.writerow([row['run_nr'], *(row[column] for column in STRING_COLUMNS),
+                              *('' if isnan(row[column]) else f'{row[column]:.3f}' for column in NUMERIC_COLUMNS)])
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class JsonLinesExporter(RunExporter):
+    """每行一个 ``run_record`` JSON 对象。"""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def write(self, run: Union[RelRun, RunAbort, BuggedRun]) -> None:
+        self.file.write(json.dumps(run_record(run), ensure_ascii=False) + '\n')
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class ArrowExporter(RunExporter):
+    """
+    写入 Arrow IPC 文件。运行按 ``batch_size`` 缓存后作为一个记录批次写入。需要安装 pyarrow。
+    """
+
+    def __init__(self, path: str, batch_size: int = 8192):
+        super().__init__(path)
+        try:
+            import pyarrow
+            import pyarrow.ipc
+        except ImportError:
+            raise ImportError('导出 Arrow IPC 文件需要安装 pyarrow：pip install pyarrow') from None
+        self.pa = pyarrow
+        self.schema = pyarrow.schema([('run_nr', pyarrow.int32()),
+                                      *((column, pyarrow.string()) for column in STRING_COLUMNS),
+                                      *((column, pyarrow.float64()) for column in NUMERIC_COLUMNS)])
+        self.writer = pyarrow.ipc.new_file(path, self.schema)
+        self.batch_size = batch_size
+        self.columns: dict[str, list] = {column: [] for column in COLUMNS}
+
+    def write(self, run: Union[RelRun, RunAbort, BuggedRun]) -> None:
+        for column, value in run_row(run).items():
+            self.columns[column].append(value)
+        if len(self.columns['run_nr']) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.columns['run_nr']:
+            arrays = [self.pa.array(self.columns[field.name], type=field.type, from_pandas=True)
+                      for field in self.schema]  # from_pandas 将 nan 视为空值
+            self.writer.write_batch(self.pa.record_batch(arrays, schema=self.schema))
+            for values in self.columns.values():
+                values.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self.writer.close()
+
+
+class NpyBundleExporter(RunExporter):
+    """
+    将每一列写入目录 ``path`` 中单独的 ``<列名>.npy`` 文件，可以用 ``numpy.load`` 读取。\n
+    数值列直接追加到文件末尾；字符串列保存为 int32 编码，编码到字符串的映射在关闭时写入 ``categories.json``。
+    .npy 文件头中的形状在关闭时回填，因此写入时不需要 numpy。
+    """
+    HEADER_SIZE = 128  # 包括魔数和长度字段，保持 64 字节对齐
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        os.makedirs(path, exist_ok=True)
+        self.dtypes = {'run_nr': ('<i4', 'i'),
+                       **{column: ('<i4', 'i') for column in STRING_COLUMNS},
+                       **{column: ('<f8', 'd') for column in NUMERIC_COLUMNS}}
+        self.categories: dict[str, dict[str, int]] = {column: {} for column in STRING_COLUMNS}
+        self.categories['outcome'] = dict(OUTCOMES)
+        self.files = {}
+        for column in COLUMNS:
+            file = open(os.path.join(path, f'{column}.npy'), 'wb')
+            file.write(self.header(column, 0))
+            self.files[column] = file
+        self.buffers = {column: array(typecode) for column, (_, typecode) in self.dtypes.items()}
+
+    def header(self, column: str, length: int) -> bytes:
+        descr, _ = self.dtypes[column]
+        header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': ({length},), }}"
+        padding = self.HEADER_SIZE - 10 - len(header) - 1
+        return b'\x93NUMPY\x01\x00' + struct.pack('<H', self.HEADER_SIZE - 10) + \
+            header.encode('latin-1') + b' ' * padding + b'\n'
+
+    def write(self, run: Union[RelRun, RunAbort, BuggedRun]) -> None:
+        for column, value in run_row(run).items():
+            if column in self.categories:
+                value = self.categories[column].setdefault(value, len(self.categories[column]))
+            self.buffers[column].append(value)
+        if len(self.buffers['run_nr']) >= 8192:
+            self.flush()
+
+    def flush(self) -> None:
+        for column, values in self.buffers.items():
+            if sys.byteorder == 'big':
+                values.byteswap()
+            values.tofile(self.files[column])
+            del values[:]
+
+    def close(self) -> None:
+        self.flush()
+        for column, file in self.files.items():
+            file.seek(0)
+            file.write(self.header(column, self.count))
+            file.close()
+        with open(os.path.join(self.path, 'categories.json'), 'w', encoding='utf-8') as file:
+            json.dump({column: {code: value for value, code in mapping.items()}
+                       for column, mapping in self.categories.items()}, file, ensure_ascii=False, indent=2)
+
+
+EXPORTERS = {'csv': CsvExporter, 'jsonl': JsonLinesExporter, 'arrow': ArrowExporter, 'npy': NpyBundleExporter}
+EXTENSIONS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.arrow': 'arrow', '.feather': 'arrow'}
+
+
+def create_exporter(path: str, format_: Optional[str] = None) -> RunExporter:
+    """
+    根据 ``format_`` 或 ``path`` 的扩展名创建导出器。没有可识别扩展名的路径导出为 .npy 目录。\n
+    :raise ValueError: ``format_`` 不是受支持的格式。
+    :raise ImportError: 格式需要的可选依赖没有安装。
+    """
+    if format_ is None:
+        format_ = EXTENSIONS.get(os.path.splitext(path)[1].lower(), 'npy')
+    if format_ not in EXPORTERS:
+        raise ValueError(f"Expected format_ to be one of {', '.join(EXPORTERS)} but was {format_}.")
+    return EXPORTERS[format_](path)
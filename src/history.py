@@ -0,0 +1,302 @@
+import sqlite3
+from collections import defaultdict
+from math import isnan
+from statistics import median
+from typing import Optional, Iterable
+
+from src.style import fg
+
+from src.analyzer import RelRun
+from src.enums.damage_types import DT
+from src.utils import time_str
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    recorded_at REAL NOT NULL,  -- Unix 时间
+    run_nr INTEGER NOT NULL,
+    nickname TEXT NOT NULL,
+    squad TEXT NOT NULL,  -- 排序后以逗号连接的全部玩家
+    length REAL NOT NULL,
+    pt_found REAL NOT NULL,
+    shield_sum REAL NOT NULL,
+    leg_sum REAL NOT NULL,
+    body_sum REAL NOT NULL,
+    pylon_sum REAL NOT NULL,
+    UNIQUE (nickname, length, pt_found)  -- 重复分析同一日志时不会重复记录
+);
+CREATE TABLE IF NOT EXISTS run_players (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    PRIMARY KEY (run_id, name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS phases (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    phase INTEGER NOT NULL,
+    duration REAL NOT NULL,  -- 从电梯到阶段结束
+    body REAL NOT NULL,
+    pylon REAL,
+    PRIMARY KEY (run_id, phase)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS shields (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    phase REAL NOT NULL,
+    idx INTEGER NOT NULL,
+    element TEXT,  -- 内部名称，例如 DT_FIRE
+    time REAL,  -- 阶段 3.5 的护盾没有时间
+    PRIMARY KEY (run_id, phase, idx)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS legs (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    phase INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    time REAL NOT NULL,
+    PRIMARY KEY (run_id, phase, idx)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS runs_nickname ON runs (nickname, length);
+CREATE INDEX IF NOT EXISTS runs_recorded_at ON runs (recorded_at);
+CREATE INDEX IF NOT EXISTS runs_length ON runs (length);
+CREATE INDEX IF NOT EXISTS runs_fight ON runs (length - pt_found);
+CREATE INDEX IF NOT EXISTS runs_shield_sum ON runs (shield_sum);
+CREATE INDEX IF NOT EXISTS runs_leg_sum ON runs (leg_sum);
+CREATE INDEX IF NOT EXISTS runs_body_sum ON runs (body_sum);
+CREATE INDEX IF NOT EXISTS runs_pylon_sum ON runs (pylon_sum);
+CREATE INDEX IF NOT EXISTS run_players_name ON run_players (name, run_id);
+CREATE INDEX IF NOT EXISTS shields_element ON shields (element, time);
+CREATE INDEX IF NOT EXISTS legs_time ON legs (time);
+DROP INDEX IF EXISTS runs_squad;  -- 按小队筛选使用 run_players，旧数据库中的此索引只会拖慢写入
+"""
+
+
+def quantiles(values: list[float], qs: Iterable[float]) -> list[float]:
+    """对已排序的 ``values`` 线性插值计算分位数。0.5 分位数与 ``statistics.median`` 相同。"""
+    results = []
+    for q in qs:
+        pos = q * (len(values) - 1)
+        lower = values[int(pos)]
+        upper = values[min(int(pos) + 1, len(values) - 1)]
+        results.append(lower + (upper - lower) * (pos - int(pos)))
+    return results
+
+
+class HistoryFilter:
+    """选择历史运行的条件。所有条件都是可选的，并以 AND 组合。"""
+
+    def __init__(self,
+                 nickname: Optional[str] = None,
+                 players: Iterable[str] = (),
+                 since: Optional[float] = None,
+                 until: Optional[float] = None):
+        self.nickname = nickname
+        self.players = sorted(set(players))
+        self.since = since
+        self.until = until
+
+    def where(self) -> tuple[str, list]:
+        """返回作用于别名为 ``r`` 的 runs 表的 WHERE 子句及其参数。"""
+        clauses, params = ['1'], []
+        if self.nickname is not None:
+            clauses.append('r.nickname = ?')
+            params.append(self.nickname)
+        for player in self.players:  # 小队必须包含所有给定的玩家
+            clauses.append('r.id IN (SELECT run_id FROM run_players WHERE name = ?)')
+            params.append(player)
+        if self.since is not None:
+            clauses.append('r.recorded_at >= ?')
+            params.append(self.since)
+        if self.until is not None:
+            clauses.append('r.recorded_at < ?')
+            params.append(self.until)
+        return ' AND '.join(clauses), params
+
+
+class RunHistory:
+    """
+    基于 SQLite 的持久运行历史。\n
+    ``add`` 只缓存运行，``flush`` 在单个事务中写入所有缓存的运行。缓存达到 ``batch_size`` 时会自动写入。
+    """
+
+    def __init__(self, path: str, batch_size: int = 500):
+        self.path = path
+        self.batch_size = batch_size
+        self.pending: list[tuple[RelRun, float]] = []
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA foreign_keys = ON')
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute('PRAGMA synchronous = NORMAL')  # WAL 模式下仍然不会损坏数据库
+        self.conn.execute('PRAGMA cache_size = -65536')  # 64 MiB，批量写入时索引页可以留在缓存中
+        self.conn.executescript(SCHEMA)
+        self._selected_key: Optional[tuple[str, list]] = None  # 临时表 selected 当前对应的条件
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self) -> None:
+        self.flush()
+        self.conn.close()
+
+    def add(self, run: RelRun, recorded_at: float) -> None:
+        self.pending.append((run, recorded_at))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        在一个事务中写入所有缓存的运行。\n
+        :return: 新写入的运行数量。已存在的运行会被跳过。
+        """
+        inserted = 0
+        players, phases, shields, legs = [], [], [], []
+        with self.conn:
+            for run, recorded_at in self.pending:
+                names = sorted(name for name in {run.nickname} | run.squad_members if name)
+                cursor = self.conn.execute(
+                    'INSERT OR IGNORE INTO runs (recorded_at, run_nr, nickname, squad, length, pt_found, '
+                    'shield_sum, leg_sum, body_sum, pylon_sum) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (recorded_at, run.run_nr, run.nickname, ','.join(names), run.length, run.pt_found,
+                     run.shield_sum, run.leg_sum, run.body_sum, run.pylon_sum))
+                if cursor.rowcount == 0:  # 重复的运行
+                    continue
+                run_id = cursor.lastrowid
+                inserted += 1
+
+                players.extend((run_id, name) for name in names)
+                phases.extend((run_id, phase, duration, run.body_dur[phase], run.pylon_dur.get(phase))
+                              for phase, duration in run.phase_durations.items())
+                shields.extend((run_id, phase, idx, shield.internal_name if shield else None,
+                                None if isnan(time) else time)
+                               for phase, shield_phase in run.shield_phases.items()
+                               for idx, (shield, time) in enumerate(shield_phase))
+                legs.extend((run_id, phase, idx, time)
+                            for phase, leg_phase in run.legs.items()
+                            for idx, time in enumerate(leg_phase))
+
+            # 子表在整批运行之后一次性写入。
+            self.conn.executemany('INSERT INTO run_players VALUES (?, ?)', players)
+            self.conn.executemany('INSERT INTO phases VALUES (?, ?, ?, ?, ?)', phases)
+            self.conn.executemany('INSERT INTO shields VALUES (?, ?, ?, ?, ?)', shields)
+            self.conn.executemany('INSERT INTO legs VALUES (?, ?, ?, ?)', legs)
+        self.pending.clear()
+        self._selected_key = None  # 新的运行可能符合条件
+        return inserted
+
+    def _selected(self, filter_: HistoryFilter) -> bool:
+        """
+        将符合 ``filter_`` 的运行 id 写入临时表 ``selected``，之后的查询可以从这些运行出发连接子表，
+        而不必在子表的每一行上检查条件。
+
+        :return: 如果 ``filter_`` 没有任何条件，则不创建临时表并返回 False。
+        """
+        where, params = filter_.where()
+        if not params:
+            return False
+        if self._selected_key != (where, params):
+            self.conn.execute('DROP TABLE IF EXISTS temp.selected')
+            self.conn.execute(f'CREATE TEMP TABLE selected AS SELECT id FROM runs r WHERE {where}', params)
+            self._selected_key = where, params
+        return True
+
+    def _indexed_quantiles(self, column: str, from_where: str, params: list,
+                           qs: Iterable[float]) -> list[Optional[float]]:
+        """
+        对带索引的列使用 ORDER BY ... LIMIT/OFFSET 计算分位数，SQLite 只需在索引上跳过行，
+        不必将所有值读入 Python。
+        """
+        count, = self.conn.execute(f'SELECT COUNT({column}) {from_where}', params).fetchone()
+        results = []
+        for q in qs:
+            if count == 0:
+                results.append(None)
+                continue
+            pos = q * (count - 1)
+            rows = self.conn.execute(f'SELECT {column} {from_where} AND {column} IS NOT NULL '
+                                     f'ORDER BY {column} LIMIT 2 OFFSET ?', params + [int(pos)]).fetchall()
+            lower = rows[0][0]
+            upper = rows[1][0] if len(rows) > 1 else lower
+            results.append(lower + (upper - lower) * (pos - int(pos)))
+        return results
+
+    def best_run(self, filter_: HistoryFilter) -> Optional[tuple]:
+        where, params = filter_.where()
+        return self.conn.execute(f'SELECT run_nr, recorded_at, squad, length FROM runs r WHERE {where} '
+                                 f'ORDER BY length LIMIT 1', params).fetchone()
+
+    def medians(self, filter_: HistoryFilter) -> dict[str, Optional[float]]:
+        """返回运行时间、战斗时间和各部分时间的中位数。"""
+        columns = {'length': 'length', 'fight': 'length - pt_found', 'shield_sum': 'shield_sum',
+                   'leg_sum': 'leg_sum', 'body_sum': 'body_sum', 'pylon_sum': 'pylon_sum'}
+        if not self._selected(filter_):  # 每一列都有索引
+            return {name: self._indexed_quantiles(column, 'FROM runs WHERE 1', [], [0.5])[0]
+                    for name, column in columns.items()}
+        rows = self.conn.execute(f'SELECT {", ".join(columns.values())} '
+                                 f'FROM selected CROSS JOIN runs r ON r.id = selected.id').fetchall()
+        if not rows:
+            return dict.fromkeys(columns)
+        return {name: median(values) for name, values in zip(columns, zip(*rows))}
+
+    def leg_median(self, filter_: HistoryFilter) -> Optional[float]:
+        """返回单条腿部破坏时间的中位数。"""
+        if not self._selected(filter_):
+            return self._indexed_quantiles('time', 'FROM legs WHERE 1', [], [0.5])[0]
+        times = [time for time, in self.conn.execute(
+            'SELECT l.time FROM selected CROSS JOIN legs l ON l.run_id = selected.id')]
+        return median(times) if times else None
+
+    def shield_distribution(self, filter_: HistoryFilter,
+                            qs: tuple[float, ...] = (0.0, 0.1, 0.5, 0.9, 1.0)) -> dict[DT, tuple[int, list]]:
+        """
+        按护盾元素统计护盾时间的分布。\n
+        :return: 元素 -> (护盾数量, ``qs`` 中各分位数的时间)。
+        """
+        distribution = {}
+        if not self._selected(filter_):  # 直接在 (element, time) 索引上计算
+            for element, in self.conn.execute('SELECT DISTINCT element FROM shields WHERE element IS NOT NULL'):
+                if (dt := DT.from_internal_name(element)) is None:
+                    continue
+                from_where = 'FROM shields WHERE element = ?'
+                count, = self.conn.execute(f'SELECT COUNT(time) {from_where}', [element]).fetchone()
+                if count:
+                    distribution[dt] = count, self._indexed_quantiles('time', from_where, [element], qs)
+            return distribution
+
+        times_by_element = defaultdict(list)
+        for element, time in self.conn.execute(
+                'SELECT s.element, s.time FROM selected CROSS JOIN shields s ON s.run_id = selected.id '
+                'WHERE s.element IS NOT NULL AND s.time IS NOT NULL'):
+            times_by_element[element].append(time)
+        for element, times in times_by_element.items():
+            if (dt := DT.from_internal_name(element)) is not None:
+                distribution[dt] = len(times), quantiles(sorted(times), qs)
+        return distribution
+
+    def count(self, filter_: HistoryFilter) -> int:
+        where, params = filter_.where()
+        return self.conn.execute(f'SELECT COUNT(*) FROM runs r WHERE {where}', params).fetchone()[0]
+
+    def print_report(self, filter_: HistoryFilter):
+        count = self.count(filter_)
+        if count == 0:
+            print(f'{fg.white}历史记录中没有符合条件的运行。')
+            return
+        run_nr, recorded_at, squad, length = self.best_run(filter_)
+        medians = self.medians(filter_)
+
+        print(f'{fg.li_green}运行数量:\t\t{fg.li_cyan}{count}')
+        print(f'{fg.li_green}最佳运行:\t\t{fg.li_cyan}{time_str(length, "units")} '
+              f'{fg.cyan}({squad.replace(",", ", ")}，第 {run_nr} 次运行)')
+        print(f'{fg.li_green}中间时间:\t\t{fg.li_cyan}{time_str(medians["length"], "units")}')
+        print(f'{fg.li_green}中间战斗持续时间:\t{fg.li_cyan}{time_str(medians["fight"], "units")}\n')
+        print(f'{fg.white} 中间护盾切换:\t{fg.li_green}{medians["shield_sum"]:7.3f}s')
+        print(f'{fg.white} 中间腿部破坏:\t{fg.li_green}{medians["leg_sum"]:7.3f}s '
+              f'{fg.white}(单条腿 {fg.li_green}{self.leg_median(filter_):.3f}s{fg.white})')
+        print(f'{fg.white} 中间身体击杀:\t{fg.li_green}{medians["body_sum"]:7.3f}s')
+        print(f'{fg.white} 中间支柱:\t\t{fg.li_green}{medians["pylon_sum"]:7.3f}s\n')
+
+        print(f'{fg.li_green}护盾时间分布 {fg.white}(数量 | 最小 | 10% | 中位数 | 90% | 最大)')
+        distribution = self.shield_distribution(filter_)
+        for dt, (shield_count, quantiles) in sorted(distribution.items(), key=lambda item: item[1][1][2]):
+            quantile_str = f'{fg.white} | '.join(f'{fg.li_yellow}{time:.3f}s' for time in quantiles)
+            print(f'{fg.white} {dt}:\t{fg.li_cyan}{shield_count:6d}{fg.white} | {quantile_str}')
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Union
+
+if TYPE_CHECKING:
+    from src.analyzer import AbsRun, RelRun
+    from src.exceptions.bugged_run import BuggedRun
+    from src.exceptions.run_abort import RunAbort
+
+
+class RunEvent:
+    """在运行过程中通知给 ``RunListener`` 的事件。"""
+    SHIELD_SWITCH = 'shield_switch'  # 护盾切换
+    SHIELDS_DONE = 'shields_done'  # 护盾阶段结束
+    LEG_KILL = 'leg_kill'  # 腿部摧毁
+    BODY_KILL = 'body_kill'  # 身体击杀
+    PHASE_END = 'phase_end'  # 阶段 1-3 结束（阶段 1 和 3 为支柱阶段结束）
+
+
+class RunListener:
+    """
+    接收分析器事件的监听器基类，默认实现不做任何事。\n
+    ``on_event`` 在读取运行时针对每个 ``RunEvent`` 调用，``on_run`` 在每次运行得出结果（有效、中止或出错）后调用，
+    ``close`` 在分析结束时调用。
+    """
+
+    def on_event(self, run: AbsRun, event: str, phase: int, time: float) -> None:
+        pass
+
+    def on_run(self, run: Union[RelRun, RunAbort, BuggedRun]) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
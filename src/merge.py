@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import heapq
+from bisect import bisect_left
+from collections import Counter, deque
+from statistics import median
+from typing import Iterable, Iterator, Optional
+
+from src.constants import PTConstants, MiscConstants
+from src.distiller import is_distilled, read_distilled, scan_relevant
+
+# 所有队员的日志中几乎同时出现的战斗事件。抢劫开始等加载事件的时间取决于各自的加载速度，不能用作锚点。
+ANCHORS = (PTConstants.PHASE_1_START, *(marker for marker in PTConstants.PHASE_ENDS.values() if marker))
+ALIGN_TOLERANCE = 2.0  # 秒，对齐后同一锚点事件在不同日志中的最大时间差
+VOTING_ANCHORS = 64
+
+DEDUPE_WINDOW = 1.0  # 秒，不同日志中相同的行在此时间内视为同一事件
+# 这些行在每个队员的日志中出现的时间取决于各自的加载速度，因此使用更大的时间窗口。
+LOADING_MARKERS = (MiscConstants.HEIST_START, MiscConstants.SQUAD_MEMBER, MiscConstants.ELEVATOR_EXIT)
+LOADING_WINDOW = 60.0
+# 这些行描述的是记录日志的玩家自己，只使用主日志中的行。
+PRIMARY_ONLY_MARKERS = (MiscConstants.NICKNAME, MiscConstants.BACK_TO_TOWN, MiscConstants.ABORT_MISSION,
+                        MiscConstants.HEIST_ABORT)
+# 主机迁移会使单个日志中的运行中止，但其他日志可以补全迁移期间的事件。
+DROPPED_MARKERS = (MiscConstants.HOST_MIGRATION,)
+
+
+def timed_lines(path: str) -> Iterator[tuple[float, str]]:
+    """
+    返回日志中所有相关行的 (时间戳, 时间戳之后的内容)。内容不含换行符。原始日志和精简日志均可。
+    没有时间戳的行被跳过。
+    """
+    with open(path, 'r', encoding='latin-1') as file:
+        distilled = is_distilled(file.readline())
+        if distilled:
+            file.seek(0)
+            lines = (line.rstrip('\r\n') for _, line in read_distilled(file))
+            yield from _split_timestamps(lines)
+    if not distilled:
+        yield from _split_timestamps(line.decode('latin-1') for _, line in scan_relevant(path))
+
+
+def _split_timestamps(lines: Iterable[str]) -> Iterator[tuple[float, str]]:
+    for line in lines:
+        timestamp, _, _ = line.partition(' ')
+        try:
+            yield float(timestamp), line[len(timestamp):]
+        except ValueError:
+            continue
+
+
+def anchor_times(path: str) -> dict[str, list[float]]:
+    """返回日志中每种锚点事件出现的时间（按时间排序）。"""
+    anchors = {marker: [] for marker in ANCHORS}
+    for time, rest in timed_lines(path):
+        for marker in ANCHORS:
+            if marker in rest:
+                anchors[marker].append(time)
+    return anchors
+
+
+def estimate_offset(reference: dict[str, list[float]], anchors: dict[str, list[float]]) -> Optional[float]:
+    """
+    估计两个日志的时钟之差。\n
+    每对同类锚点事件为它们的时间差投票，得票最多的时间差即为两个日志中同一次运行的锚点事件之差；
+    然后取所有在此时间差附近配对的锚点事件的时间差中位数。只有 ``anchors`` 中每种事件的前 ``VOTING_ANCHORS`` 个参与投票，
+    使成本与日志长度成线性关系。\n
+    :return: 加到 ``anchors`` 的时间上使其与 ``reference`` 对齐的偏移。没有共同的锚点事件时返回 None。
+    """
+    votes = Counter(round((ref_time - time) / ALIGN_TOLERANCE) for marker in ANCHORS
+                    for ref_time in reference[marker] for time in anchors[marker][:VOTING_ANCHORS])
+    if not votes:
+        return None
+    # 真实的时间差可能落在两个桶的边界上，因此同时计算相邻的桶。
+    bucket = max(votes, key=lambda b: votes[b - 1] + votes[b] + votes[b + 1])
+    estimate = bucket * ALIGN_TOLERANCE
+
+    differences = []
+    for marker in ANCHORS:
+        ref_times = reference[marker]
+        if not ref_times:  # 例如主日志只记录了队友日志中某次运行的第一阶段
+            continue
+        for time in anchors[marker]:
+            i = bisect_left(ref_times, time + estimate)
+            nearest = min(ref_times[max(i - 1, 0):i + 1], key=lambda ref_time: abs(ref_time - time - estimate))
+            if abs(nearest - time - estimate) <= 1.5 * ALIGN_TOLERANCE:
+                differences.append(nearest - time)
+    return median(differences) if differences else None
+
+
+def align(paths: list[str]) -> list[Optional[float]]:
+    """返回每个日志相对于第一个（主）日志的时钟偏移。无法对齐的日志偏移为 None。"""
+    reference = anchor_times(paths[0])
+    return [0.0] + [estimate_offset(reference, anchor_times(path)) for path in paths[1:]]
+
+
+def _shifted(path: str, source: int, offset: float) -> Iterator[tuple[float, int, str]]:
+    for time, rest in timed_lines(path):
+        yield time + offset, source, rest
+
+
+def merge_lines(paths: list[str], offsets: list[Optional[float]]) -> Iterator[str]:
+    """
+    将多个日志合并为一条共同的时间线，时间戳使用主日志的时钟。\n
+    各日志已按时间排序，因此使用堆进行 k 路归并，每个日志只保留一行。不同日志中记录的同一事件只保留最先出现的一个，
+    因此一个日志中缺失的事件由其他日志补全。内存占用只取决于日志数量和去重时间窗口内的事件数量，与日志大小无关。\n
+    :param paths: 日志的路径，第一个为主日志。
+    :param offsets: ``align`` 返回的偏移。偏移为 None 的日志被忽略。
+    :return: 合并后的日志行，以换行符结尾。
+    """
+    streams = [_shifted(path, source, offset)
+               for source, (path, offset) in enumerate(zip(paths, offsets)) if offset is not None]
+    recent: deque[tuple[float, str, set[int]]] = deque()  # 最近输出的事件：(时间, 内容, 记录了它的日志)
+    for time, source, rest in heapq.merge(*streams):
+        if any(marker in rest for marker in DROPPED_MARKERS):
+            continue
+        if source != 0 and any(marker in rest for marker in PRIMARY_ONLY_MARKERS):
+            continue
+
+        while recent and recent[0][0] < time - LOADING_WINDOW:
+            recent.popleft()
+        window = LOADING_WINDOW if any(marker in rest for marker in LOADING_MARKERS) else DEDUPE_WINDOW
+        # 每个日志中同一内容的第 n 次出现对应第 n 个事件，因此只与尚未被此日志记录的事件匹配。
+        duplicate = next((sources for event_time, event_rest, sources in recent
+                          if event_rest == rest and source not in sources and time - event_time <= window), None)
+        if duplicate is not None:
+            duplicate.add(source)
+            continue
+        recent.append((time, rest, {source}))
+        yield f'{time:.3f}{rest}\n'
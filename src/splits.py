@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Optional, Union
+
+from src.style import fg
+
+from src.exceptions.bugged_run import BuggedRun
+from src.exceptions.run_abort import RunAbort
+from src.listeners import RunEvent, RunListener
+from src.utils import time_str
+
+if TYPE_CHECKING:
+    from src.analyzer import AbsRun, RelRun
+
+
+class SplitTracker(RunListener):
+    """
+    在跟随模式中实时打印每个分段的运行时间及其与最佳运行的差值。\n
+    最佳运行的分段表在新的最佳运行出现时预先计算一次，之后每个事件只需常数时间的字典查找。
+    """
+
+    def __init__(self):
+        self.best: Optional[RelRun] = None
+        self.splits: dict[tuple, float] = {}  # (事件, 阶段[, 序号]) -> 最佳运行中从电梯开始的累计时间
+
+    def on_run(self, run: Union[RelRun, RunAbort, BuggedRun]) -> None:
+        if isinstance(run, (RunAbort, BuggedRun)):
+            return
+        if self.best is None or run.length < self.best.length:
+            self.set_best(run)
+
+    def set_best(self, run: RelRun) -> None:
+        """根据 ``run`` 的阶段时间、护盾和腿部时间重新计算分段表。"""
+        splits = {}
+        for phase in [1, 2, 3, 4]:
+            elapsed = run.pt_found if phase == 1 else run.phase_durations[phase - 1]
+            if phase in [1, 3, 4]:
+                for i, (_, shield_time) in enumerate(run.shield_phases[phase]):
+                    elapsed += shield_time
+                    splits[RunEvent.SHIELD_SWITCH, phase, i] = elapsed
+                # 最后一个护盾由护盾阶段结束传输结束，而不是护盾切换。
+                splits[RunEvent.SHIELDS_DONE, phase] = splits.pop((RunEvent.SHIELD_SWITCH, phase, i))
+            for i, leg_time in enumerate(run.legs[phase]):
+                elapsed += leg_time
+                splits[RunEvent.LEG_KILL, phase, i] = elapsed
+            # 阶段 2 和 4 在身体击杀时结束，阶段 1 和 3 在支柱阶段后结束。
+            if phase in [2, 4]:
+                splits[RunEvent.BODY_KILL, phase] = run.phase_durations[phase]
+            else:
+                splits[RunEvent.PHASE_END, phase] = run.phase_durations[phase]
+        self.best = run
+        self.splits = splits
+
+    def on_event(self, run: AbsRun, event: str, phase: int, time: float) -> None:
+        if event == RunEvent.SHIELD_SWITCH:
+            if phase == 3 and 3 in run.pylon_start:  # 阶段 3.5 的护盾不计时
+                return
+            # 每次护盾切换结束上一个护盾。阶段 4 的第一个护盾是阶段 3.5 的最后一个护盾。
+            index = len(run.shield_phases[phase]) - 2 + (phase == 4 and len(run.shield_phases[3.5]) > 0)
+            if index < 0:
+                return
+            key, label = (event, phase, index), f'护盾 {index + 1}'
+            # 阶段 4 的最后一次护盾切换是 ``AbsRun.post_process`` 会移除的额外护盾，最佳运行中没有对应的分段。
+            if self.best is not None and key not in self.splits:
+                return
+        elif event == RunEvent.SHIELDS_DONE:
+            key, label = (event, phase), '护盾阶段'
+        elif event == RunEvent.LEG_KILL:
+            index = len(run.legs[phase]) - 1
+            key, label = (event, phase, index), f'腿部 {index + 1}'
+        elif event == RunEvent.BODY_KILL:
+            key, label = (event, phase), '身体击杀'
+        elif event == RunEvent.PHASE_END and phase in [1, 3]:
+            key, label = (event, phase), '支柱'
+        else:
+            return
+
+        elapsed = time - run.heist_start
+        split_str = f'{fg.white}阶段 {phase} {label}:\t{fg.li_cyan}{time_str(elapsed, "units")}'
+        if key in self.splits:
+            split_str += f' {self.delta_str(elapsed - self.splits[key])}'
+        if event == RunEvent.BODY_KILL and phase in run.body_vuln:  # 同时比较身体击杀本身的用时
+            body_time = time - run.body_vuln[phase]
+            split_str += f'{fg.white} (身体 {fg.li_green}{body_time:.3f}s'
+            if self.best is not None:
+                split_str += f' {self.delta_str(body_time - self.best.body_dur[phase])}'
+            split_str += f'{fg.white})'
+        print(split_str)
+
+    @staticmethod
+    def delta_str(delta: float) -> str:
+        return f'{fg.li_green if delta <= 0 else fg.li_red}{delta:+.3f}s'
@@ -0,0 +1,416 @@
+from __future__ import annotations
+
+import json
+import random
+import selectors
+import socket
+import struct
+import threading
+import uuid
+import zlib
+from collections import deque
+from time import monotonic, sleep, time as current_time
+from typing import Callable, Optional, Union
+
+from src.style import fg
+
+from src.analyzer import Analyzer, RelRun
+from src.constants import MiscConstants, RELEVANT_PATTERN
+from src.exceptions.bugged_run import BuggedRun
+from src.exceptions.log_end import LogEnd
+from src.exceptions.run_abort import RunAbort
+from src.listeners import RunListener
+from src.utils import time_str
+
+PROTOCOL_VERSION = 2
+HEADER = struct.Struct('!BI')  # 消息类型，负载长度
+OFFSET = struct.Struct('!Q')  # 批次序号或输出流中的字节偏移
+HELLO = 1  # 客机 -> 主机：JSON，{"version": 协议版本, "client": 客机 id, "cursor": 已收到的输出的字节数}
+LOG_BATCH = 2  # 客机 -> 主机：批次序号 + zlib 压缩的日志行（latin-1，每行以换行结尾）
+WELCOME = 3  # 主机 -> 客机：JSON，{"batch": 主机已收到的最后一个批次的序号}
+OUTPUT = 4  # 主机 -> 客机：字节偏移 + 主机控制台输出（UTF-8）
+SNAPSHOT = 5  # 主机 -> 客机：字节偏移 + 当前状态的输出，客机错过的输出已不再保留时代替 OUTPUT 发送
+MAX_FRAME = 4 * 1024 * 1024  # 超过此长度的消息表示数据流已损坏
+MAX_BATCH_TEXT = 16 * 1024 * 1024  # 解压后的批次的最大长度
+
+BATCH_INTERVAL = 0.5  # 秒，客机最多等待这么久就发送已过滤的行
+BATCH_BYTES = 64 * 1024  # 已过滤的行达到此长度时切分为一个批次（例如读取已有的日志时）
+RESEND_BATCHES = 64  # 客机保留的已发送批次数量，重新连接后重发主机未收到的批次
+MAX_PENDING_LINES = 20_000  # 一次未完成的运行最多缓存的行数，超过时放弃这次运行
+RETAINED_OUTPUT = 1024 * 1024  # 主机为重新连接的客机保留的输出字节数
+SEND_TIMEOUT = 5.0  # 秒，向客机发送输出的超时时间；过慢的客机被断开，之后会重新连接并补发
+RECONNECT_DELAY = 0.5  # 秒，第一次重新连接前的等待时间，之后每次加倍
+MAX_RECONNECT_DELAY = 30.0
+
+
+def encode_frame(kind: int, payload: bytes) -> bytes:
+    return HEADER.pack(kind, len(payload)) + payload
+
+
+def encode_batch(seq: int, lines: list[str]) -> bytes:
+    return encode_frame(LOG_BATCH, OFFSET.pack(seq) + zlib.compress(''.join(lines).encode('latin-1')))
+
+
+def decode_batch(payload: bytes) -> tuple[int, list[str]]:
+    """
+    :raise ValueError: 批次解压后过长或不完整。
+    :raise zlib.error: 批次不是有效的 zlib 数据。
+    :return: 批次序号和日志行。
+    """
+    decompressor = zlib.decompressobj()
+    text = decompressor.decompress(payload[OFFSET.size:], MAX_BATCH_TEXT)
+    if decompressor.unconsumed_tail or not decompressor.eof:
+        raise ValueError('Log batch is too large or truncated.')
+    return OFFSET.unpack_from(payload)[0], [line + '\n' for line in text.decode('latin-1').split('\n')[:-1]]
+
+
+def encode_json(kind: int, message: dict) -> bytes:
+    return encode_frame(kind, json.dumps(message).encode('utf-8'))
+
+
+def encode_output(kind: int, offset: int, data: bytes) -> bytes:
+    return encode_frame(kind, OFFSET.pack(offset) + data)
+
+
+class FrameReader:
+    """将从连接中收到的字节拆分为完整的消息。"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data: bytes) -> list[tuple[int, bytes]]:
+        """
+        :raise ValueError: 消息长度超过 ``MAX_FRAME``。
+        :return: 收到的完整消息列表((类型, 负载))。
+        """
+        self.buffer += data
+        frames = []
+        pos = 0
+        while len(self.buffer) - pos >= HEADER.size:
+            kind, length = HEADER.unpack_from(self.buffer, pos)
+            if length > MAX_FRAME:
+                raise ValueError(f'Frame of {length} bytes exceeds the maximum of {MAX_FRAME} bytes.')
+            end = pos + HEADER.size + length
+            if len(self.buffer) < end:
+                break
+            frames.append((kind, bytes(self.buffer[pos + HEADER.size:end])))
+            pos = end
+        del self.buffer[:pos]
+        return frames
+
+
+class OutputHistory:
+    """
+    主机控制台输出的流。每个字节有一个单调递增的偏移（即序号），客机以已收到的字节数作为游标。\n
+    只保留最后 ``RETAINED_OUTPUT`` 字节，因此重新连接的代价只取决于客机错过的输出，而与会话长度无关。
+    游标过旧时，改为发送从最近的检查点（上一次运行结果的输出）开始的快照。
+    """
+
+    def __init__(self, retained: int = RETAINED_OUTPUT):
+        self.retained = retained
+        self.data = bytearray()
+        self.start = 0  # self.data[0] 的偏移
+        self.checkpoint = 0
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.data)
+
+    def append(self, message: str) -> tuple[int, bytes]:
+        """添加输出并返回其偏移和编码后的字节。"""
+        data = message.encode('utf-8')
+        offset = self.end
+        self.data += data
+        if len(self.data) > 2 * self.retained:  # 分摊删除的成本
+            trimmed = len(self.data) - self.retained
+            del self.data[:trimmed]
+            self.start += trimmed
+        return offset, data
+
+    def mark_checkpoint(self) -> None:
+        """将当前位置作为快照的起点。"""
+        self.checkpoint = self.end
+
+    def since(self, cursor: int) -> tuple[int, int, bytes]:
+        """
+        返回客机从 ``cursor`` 继续所需的消息类型、偏移和数据。\n
+        :return: ``(OUTPUT, cursor, 错过的输出)``，或在错过的输出已不再保留时返回 ``(SNAPSHOT, 偏移, 快照)``。
+        """
+        if self.start <= cursor <= self.end:
+            return OUTPUT, cursor, bytes(self.data[cursor - self.start:])
+        start = self.checkpoint
+        if start < self.start:  # 检查点本身也已不再保留，从保留的第一个完整行开始
+            start = self.start + self.data.find(b'\n') + 1
+        return SNAPSHOT, start, bytes(self.data[start - self.start:])
+
+
+class OutputCheckpoint(RunListener):
+    """在每次运行结束时为 ``OutputHistory`` 设置检查点，使快照从最新的运行结果开始。"""
+
+    def __init__(self, history: OutputHistory):
+        self.history = history
+
+    def on_run(self, run: Union[RelRun, RunAbort, BuggedRun]) -> None:
+        self.history.mark_checkpoint()
+
+
+class LogStreamer:
+    """
+    在后台跟随本地日志，只将与利润收割者相关的行压缩成批次发送给主机。\n
+    过滤在客机上进行，因此通过内网穿透传输的数据通常只有原日志的百分之几。已过滤的行无论是否连接都按 ``BATCH_BYTES``
+    切分成批次并排队，断开连接期间（包括连接前读取已有的日志时）排队的批次在重新连接后依次发送；
+    最近发送的批次被保留，重新连接时重发主机没有收到的批次。
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.sock: Optional[socket.socket] = None
+        self.seq = 0
+        self.queued: deque[tuple[int, bytes]] = deque()  # 尚未发送的批次
+        self.sent: deque[tuple[int, bytes]] = deque(maxlen=RESEND_BATCHES)
+
+    def attach(self, sock: socket.socket, received: int) -> None:
+        """开始向 ``sock`` 发送批次。首先重发序号大于 ``received`` 的已发送批次，然后发送排队的批次。"""
+        with self.lock:
+            for seq, frame in self.sent:
+                if seq > received:
+                    sock.sendall(frame)
+            self.sock = sock
+            self._send_queued()
+
+    def detach(self) -> None:
+        with self.lock:
+            self.sock = None
+
+    def run(self) -> None:
+        pending, pending_size, last_batch = [], 0, monotonic()
+        for lines in Analyzer.follow_batches(self.filename):
+            for line in lines:
+                if RELEVANT_PATTERN.search(line):
+                    pending.append(line)
+                    pending_size += len(line)
+                    if pending_size >= BATCH_BYTES:
+                        self.queue(pending)
+                        pending, pending_size, last_batch = [], 0, monotonic()
+            if pending and monotonic() - last_batch >= BATCH_INTERVAL:
+                self.queue(pending)
+                pending, pending_size, last_batch = [], 0, monotonic()
+
+    def queue(self, lines: list[str]) -> None:
+        """将 ``lines`` 作为一个批次排队，并在已连接时发送所有排队的批次。"""
+        with self.lock:
+            self.seq += 1
+            self.queued.append((self.seq, encode_batch(self.seq, lines)))
+            self._send_queued()
+
+    def _send_queued(self) -> None:
+        while self.sock is not None and self.queued:
+            batch = self.queued.popleft()
+            self.sent.append(batch)
+            try:
+                self.sock.sendall(batch[1])
+            except OSError:
+                self.sock = None  # 接收线程会重新连接，然后重发此批次
+
+
+def run_client(ip: str, port: int, streamer: Optional[LogStreamer]) -> None:
+    """
+    连接到主机并显示它的输出。连接断开时以指数退避自动重新连接，并从已收到的输出之后继续。
+    """
+    client_id = uuid.uuid4().hex  # 主机以此识别重新连接的客机，保留其未完成的运行
+    session, cursor = None, 0  # 游标只在同一个主机会话中有效
+    delay = RECONNECT_DELAY
+    while True:
+        try:
+            with socket.create_connection((ip, port), timeout=10) as sock:
+                sock.settimeout(None)
+                sock.sendall(encode_json(HELLO, {'version': PROTOCOL_VERSION, 'client': client_id,
+                                                 'session': session, 'cursor': cursor}))
+                reader = FrameReader()
+                while data := sock.recv(65536):
+                    for kind, payload in reader.feed(data):
+                        if kind == WELCOME:
+                            welcome = json.loads(payload)
+                            print(f'{fg.li_grey}已重新连接主机。' if session == welcome['session'] else '已连接主机。')
+                            if session != welcome['session']:
+                                session, cursor = welcome['session'], 0
+                            delay = RECONNECT_DELAY
+                            if streamer is not None:
+                                streamer.attach(sock, welcome['batch'])
+                        elif kind in (OUTPUT, SNAPSHOT):
+                            offset, = OFFSET.unpack_from(payload)
+                            output = payload[OFFSET.size:]
+                            if kind == SNAPSHOT:
+                                print(f'{fg.li_grey}已跳过较早的输出，以下是最新的结果：')
+                            elif offset < cursor:  # 已经显示过的部分
+                                output = output[cursor - offset:]
+                            print(output.decode('utf-8', errors='replace'), end='', flush=True)
+                            cursor = offset + len(payload) - OFFSET.size if kind == SNAPSHOT else \
+                                max(cursor, offset + len(payload) - OFFSET.size)
+        except (OSError, ValueError):
+            pass
+        if streamer is not None:
+            streamer.detach()
+        print(f'{fg.li_red}与主机的连接已断开，{delay:.1f} 秒后重新连接...')
+        sleep(delay * random.uniform(0.8, 1.2))  # 随机化，避免多个客机同时重新连接
+        delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+
+class PlayerLog(RunListener):
+    """
+    主机上一个客机日志的增量分析器。\n
+    分析器以拉取的方式读取日志，读到末尾时抛出 ``LogEnd``。因此每收到一个批次，就从当前未完成运行的第一行开始
+    重新读取缓存的行，运行结束后丢弃它已读取的行。已过滤的日志每次运行只有几百行，重新读取的成本可以忽略，
+    而且不需要为每个玩家使用单独的线程。
+    """
+
+    def __init__(self, client: str, address: str,
+                 on_result: Callable[[PlayerLog, Union[RelRun, RunAbort, BuggedRun]], None]):
+        self.client = client  # 客机 id，重新连接后不变，昵称出现之前也可以识别玩家
+        self.address = address
+        self.nickname = ''
+        self.on_result = on_result
+        self.analyzer = Analyzer()
+        self.analyzer.listeners.append(self)
+        self.lines: list[str] = []  # 当前未完成运行的行
+        self.require_heist_start = True
+        self.batch = 0  # 已分析的最后一个批次的序号，重新连接后重发的批次不会被分析两次
+
+    @property
+    def name(self) -> str:
+        return self.nickname or self.address
+
+    def feed(self, lines: list[str]) -> None:
+        """添加收到的行，并分析所有已经结束的运行。"""
+        self.lines.extend(lines)
+        while True:
+            if self.require_heist_start:  # 抢劫开始之前的行会被跳过，不必保留
+                start = next((i for i, line in enumerate(self.lines) if MiscConstants.HEIST_START in line), None)
+                del self.lines[:len(self.lines) if start is None else start]
+            if not self.lines:
+                return
+            if len(self.lines) > MAX_PENDING_LINES:  # 运行一直没有结束，日志可能不完整
+                self.lines.clear()
+                self.require_heist_start = True
+                return
+
+            consumed = 0
+
+            def replay():
+                nonlocal consumed
+                while consumed < len(self.lines):
+                    consumed += 1
+                    yield self.lines[consumed - 1]
+
+            try:
+                try:
+                    result = self.analyzer.read_run(replay(), self.analyzer.run_count + 1,
+                                                    self.require_heist_start).to_rel()
+                    self.require_heist_start = True
+                except RunAbort as abort:
+                    result, self.require_heist_start = abort, abort.require_heist_start
+                except BuggedRun as bugged_run:
+                    result, self.require_heist_start = bugged_run, True
+            except LogEnd:
+                return  # 运行尚未结束，等待下一个批次
+            del self.lines[:consumed]
+            self.analyzer.record_run(result, current_time())
+
+    def on_run(self, run: Union[RelRun, RunAbort, BuggedRun]) -> None:
+        abs_run = run.run if isinstance(run, (RunAbort, BuggedRun)) else run
+        self.nickname = abs_run.nickname or self.nickname
+        self.on_result(self, run)
+
+
+def player_run_str(name: str, run: Union[RelRun, RunAbort, BuggedRun]) -> str:
+    """返回客机运行结果的一行摘要。"""
+    if isinstance(run, RunAbort):
+        run_nr, outcome = run.run.run_nr, f'{fg.cyan}已经中止'
+    elif isinstance(run, BuggedRun):
+        run_nr, outcome = run.run.run_nr, f'{fg.li_red}出现问题（{"；".join(run.reasons)}）'
+    else:
+        run_nr, outcome = run.run_nr, f'{fg.cyan}以 {fg.li_cyan}{time_str(run.length, "units")}{fg.cyan} 清除'
+    return f'{fg.li_cyan}{name}{fg.cyan} 的日志：利润收割者圆蛛 第 {run_nr} 次运行 {outcome}'
+
+
+class SquadHost:
+    """
+    在单个线程中接受客机的连接，并读取它们发送的日志批次。每个客机的日志由一个 ``PlayerLog`` 增量分析。\n
+    ``PlayerLog`` 以客机 id 保存，客机断开后重新连接时继续分析其未完成的运行。
+    """
+
+    def __init__(self, port: int,
+                 on_connect: Callable[[socket.socket, int], None],
+                 on_disconnect: Callable[[socket.socket], None],
+                 on_result: Callable[[PlayerLog, Union[RelRun, RunAbort, BuggedRun]], None]):
+        self.on_connect = on_connect
+        self.on_disconnect = on_disconnect
+        self.on_result = on_result
+        self.session = uuid.uuid4().hex
+        self.players: dict[str, PlayerLog] = {}  # 客机 id -> 日志
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.bind(('', port))
+        self.server_socket.listen(5)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.server_socket, selectors.EVENT_READ)
+
+    def serve_forever(self) -> None:
+        while True:
+            for key, _ in self.selector.select():
+                if key.fileobj is self.server_socket:
+                    self.accept()
+                else:
+                    self.read(key.fileobj, key.data)
+
+    def accept(self) -> None:
+        conn, addr = self.server_socket.accept()
+        conn.settimeout(SEND_TIMEOUT)  # 只在可读时接收，因此超时只影响发送
+        # 连接的数据：[消息读取器, 地址, 客机的 PlayerLog（收到 HELLO 之前为 None）]
+        self.selector.register(conn, selectors.EVENT_READ, [FrameReader(), f'{addr[0]}:{addr[1]}', None])
+
+    def read(self, conn: socket.socket, data: list) -> None:
+        reader, address, player = data
+        try:
+            received = conn.recv(65536)
+        except OSError:
+            received = b''
+        if not received:
+            self.close(conn)
+            return
+
+        # noinspection PyBroadException
+        try:
+            for kind, payload in reader.feed(received):
+                if kind == HELLO:
+                    data[2] = player = self.hello(conn, address, json.loads(payload))
+                elif kind == LOG_BATCH and player is not None:
+                    seq, lines = decode_batch(payload)
+                    if seq > player.batch:
+                        player.batch = seq
+                        player.feed(lines)
+        except OSError:
+            self.close(conn)
+        except Exception:  # 客机发送的数据无法解析，不能影响主机和其他客机
+            print(f'{fg.li_red}无法分析 {address if player is None else player.name} 发送的数据，已断开连接。')
+            self.close(conn)
+
+    def hello(self, conn: socket.socket, address: str, hello: dict) -> PlayerLog:
+        """
+        :raise ValueError: 客机使用不同的协议版本。
+        :raise OSError: 无法向客机发送。
+        """
+        if hello.get('version') != PROTOCOL_VERSION:
+            raise ValueError(f"Expected protocol version {PROTOCOL_VERSION} but was {hello.get('version')}.")
+        player = self.players.get(hello['client'])
+        if player is None:
+            player = self.players[hello['client']] = PlayerLog(hello['client'], address, self.on_result)
+        conn.sendall(encode_json(WELCOME, {'session': self.session, 'batch': player.batch}))
+        # 其他主机会话的游标没有意义
+        self.on_connect(conn, hello['cursor'] if hello.get('session') == self.session else 0)
+        return player
+
+    def close(self, conn: socket.socket) -> None:
+        self.selector.unregister(conn)
+        self.on_disconnect(conn)
+        conn.close()
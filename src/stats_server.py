@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import json
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from time import time as current_time
+from typing import TYPE_CHECKING, Union, Optional, Callable
+
+from src.exceptions.bugged_run import BuggedRun
+from src.exceptions.run_abort import RunAbort
+from src.export import run_record
+from src.listeners import RunListener
+
+if TYPE_CHECKING:
+    from src.analyzer import Analyzer, AbsRun, RelRun
+    from src.squad import PlayerLog
+
+KEEPALIVE_INTERVAL = 15  # 秒，SSE 连接在没有事件时发送注释以保持连接
+
+
+class StatsState(RunListener):
+    """
+    保存通过 HTTP 提供的统计数据。\n
+    分析器的事件只更新小的字典并增加对应资源的版本号；JSON 只在资源变化后第一次被请求时序列化一次，
+    之后所有请求（以及带有匹配 ETag 的 304 响应）都直接使用缓存的字节。
+    """
+
+    def __init__(self, analyzer: Analyzer, event_backlog: int = 256):
+        self.analyzer = analyzer
+        self.session = f'{int(current_time()):x}'  # 使重启后的 ETag 和 SSE 事件 id 不会与之前的冲突
+        self.condition = threading.Condition()
+        self.resources: dict[str, Callable[[], object]] = {
+            'state': lambda: self.state,
+            'last': lambda: self.last_run,
+            'summary': self.build_summary,
+            'players': lambda: self.players,
+        }
+        self.versions = dict.fromkeys(self.resources, 0)
+        self.cache: dict[str, tuple[int, str, bytes]] = {}  # 资源 -> (版本, ETag, JSON)
+        self.state: Optional[dict] = None
+        self.last_run: Optional[dict] = None
+        # 多人模式中客机日志的结果：客机 id -> 昵称、地址、运行次数、最佳运行、上一次运行
+        self.players: dict[str, dict] = {}
+        self.event_id = 0
+        self.events: deque[tuple[int, bytes]] = deque(maxlen=event_backlog)  # (事件 id, 已编码的 SSE 消息)
+
+    def on_event(self, run: AbsRun, event: str, phase: int, time: float) -> None:
+        state = {'run_nr': run.run_nr, 'phase': phase, 'event': event,
+                 'elapsed': round(time - run.heist_start, 3),
+                 'shields': len(run.shield_phases.get(phase, ())), 'legs': len(run.legs.get(phase, ()))}
+        with self.condition:
+            self.state = state
+            self.versions['state'] += 1
+            self.publish('event', state)
+
+    def on_run(self, run: Union[RelRun, RunAbort, BuggedRun]) -> None:
+        record = run_record(run)
+        with self.condition:
+            self.state = None
+            self.last_run = record
+            for resource in ['state', 'last', 'summary']:
+                self.versions[resource] += 1
+            self.publish('run', record)
+
+    def build_summary(self) -> dict:
+        """
+        返回 /summary 的内容。统计数据需要遍历所有有效运行，因此只由 ``snapshot`` 在资源变化后第一次被请求时计算，
+        而不是在每次运行结束时计算。
+        """
+        summary = {'runs': self.analyzer.run_count, 'proper_runs': len(self.analyzer.proper_runs)}
+        if self.analyzer.proper_runs:
+            stats = self.analyzer.summary()
+            best_run = stats.pop('best_run')
+            summary['best_run'] = {'run_nr': best_run.run_nr, 'length': round(best_run.length, 3)}
+            summary['medians'] = {key: round(value, 3) for key, value in stats.items()}
+        return summary
+
+    def on_player_run(self, player: PlayerLog, run: Union[RelRun, RunAbort, BuggedRun]) -> None:
+        """记录主机为客机分析的运行结果。玩家以客机 id 区分，昵称在读到后作为字段更新。"""
+        record = run_record(run)
+        with self.condition:
+            entry = self.players.setdefault(player.client, {'nickname': None, 'address': player.address,
+                                                            'runs': 0, 'best_run': None, 'last_run': None})
+            entry['nickname'] = player.nickname or None
+            entry['runs'] += 1
+            entry['last_run'] = record
+            if record['outcome'] == 'cleared' and \
+                    (entry['best_run'] is None or record['length'] < entry['best_run']['length']):
+                entry['best_run'] = record
+            self.versions['players'] += 1
+            self.publish('player_run', {'player': player.client, 'name': player.name, **record})
+
+    def publish(self, event: str, data: object) -> None:
+        """添加一个 SSE 消息并唤醒所有等待的连接。调用者必须持有 ``self.condition``。"""
+        self.event_id += 1
+        message = f'id: {self.session}-{self.event_id}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+        self.events.append((self.event_id, message.encode('utf-8')))
+        self.condition.notify_all()
+
+    def snapshot(self, resource: str) -> tuple[str, bytes]:
+        """
+        返回资源的 ETag 和 JSON。只有在资源的版本变化后才重新序列化。\n
+        :raise KeyError: 未知的资源。
+        """
+        with self.condition:
+            version = self.versions[resource]
+            cached = self.cache.get(resource)
+            if cached is None or cached[0] != version:
+                body = json.dumps(self.resources[resource](), ensure_ascii=False).encode('utf-8')
+                cached = version, f'"{self.session}-{resource}-{version}"', body
+                self.cache[resource] = cached
+            return cached[1], cached[2]
+
+    def resume_point(self, last_event_id: Optional[str]) -> int:
+        """
+        返回重新连接的 SSE 连接应从哪个事件 id 之后继续。\n
+        :param last_event_id: 浏览器发送的 ``Last-Event-ID``。来自之前的会话（服务器已重启）、无效或没有时从现在开始。
+        """
+        with self.condition:
+            session, _, event_id = (last_event_id or '').rpartition('-')
+            if session != self.session or not event_id.isdigit() or int(event_id) > self.event_id:
+                return self.event_id
+            return int(event_id)
+
+    def events_after(self, event_id: int, timeout: float) -> list[tuple[int, bytes]]:
+        """等待并返回 id 大于 ``event_id`` 的已保留事件。超时时返回空列表。"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.event_id > event_id, timeout)
+            return [event for event in self.events if event[0] > event_id]
+
+
+class StatsRequestHandler(BaseHTTPRequestHandler):
+    server: StatsServer
+    protocol_version = 'HTTP/1.1'  # 保持连接，轮询的客户端不必每次重新建立 TCP 连接
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0].strip('/')
+        if path == 'events':
+            self.stream_events()
+            return
+        try:
+            etag, body = self.server.state.snapshot(path or 'summary')
+        except KeyError:
+            self.send_error(404)
+            return
+
+        if etag in self.headers.get('If-None-Match', ''):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')  # 每次都要重新验证，但可以使用 304
+        self.send_header('Access-Control-Allow-Origin', '*')  # 允许 OBS 浏览器源等页面读取
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream_events(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.close_connection = True
+
+        state = self.server.state
+        last_id = state.resume_point(self.headers.get('Last-Event-ID'))  # 重新连接时补发错过的事件
+        try:
+            while True:
+                events = state.events_after(last_id, KEEPALIVE_INTERVAL)
+                if events:
+                    self.wfile.write(b''.join(message for _, message in events))
+                    last_id = events[-1][0]
+                else:
+                    self.wfile.write(b': keepalive\n\n')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+            pass
+
+    def log_message(self, format_, *args):
+        pass  # 不要把每个请求打印到（会被转发给客机的）控制台
+
+
+class StatsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, state: StatsState, port: int, host: str = ''):
+        super().__init__((host, port), StatsRequestHandler)
+        self.state = state
+
+
+def start_stats_server(analyzer: Analyzer, port: int) -> StatsServer:
+    """
+    在后台线程中启动 HTTP 统计服务器，并将其状态注册为 ``analyzer`` 的监听器。\n
+    提供 /state（当前运行）、/last（上一次运行）、/summary（统计数据）、/players（客机日志的结果）的 JSON
+    以及 /events（SSE 实时事件）。
+    """
+    state = StatsState(analyzer)
+    analyzer.listeners.append(state)
+    server = StatsServer(state, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
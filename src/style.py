@@ -0,0 +1,41 @@
+"""
+终端颜色。``fg`` 和 ``rs`` 可以像 sty 的同名对象一样使用，但 sty 和 colorama 只在第一次使用颜色时才导入；
+无颜色模式下它们从不被导入，所有颜色代码都是空字符串。
+"""
+import os
+
+_enabled = 'NO_COLOR' not in os.environ  # https://no-color.org/
+
+
+def init(color: bool = True) -> None:
+    """
+    在打印任何内容之前调用。启用颜色时初始化 colorama，使 ANSI 颜色在 Windows 控制台中工作。\n
+    :param color: 为 False 或设置了环境变量 NO_COLOR 时不输出颜色代码。
+    """
+    global _enabled
+    _enabled = _enabled and color
+    if _enabled:
+        import colorama
+        colorama.init()
+
+
+class _LazyRegister:
+    """sty 的 ``Register`` 的代理。每个属性只在第一次访问时解析，之后作为普通的实例属性缓存。"""
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, attr: str) -> str:
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        if _enabled:
+            import sty
+            value = getattr(getattr(sty, self._name), attr)
+        else:
+            value = ''
+        setattr(self, attr, value)
+        return value
+
+
+fg = _LazyRegister('fg')
+rs = _LazyRegister('rs')
@@ -1,7 +1,7 @@
 from math import isnan
 from typing import Iterable, Literal
 
-from sty import rs
+from src.style import rs
 
 
 def color(text: str, col: str) -> str: